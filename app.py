@@ -1,18 +1,184 @@
-from flask import Flask, request, jsonify, render_template, session
+from flask import Flask, Response, request, render_template, send_from_directory, session, json, g, has_request_context, url_for
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
+import csv
+import gzip
+import hashlib
+import io
+import math
+import mimetypes
+import os
 import random
-import string
-from datetime import datetime
-from sqlalchemy.exc import SQLAlchemyError
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+from datetime import datetime, timedelta
+from sqlalchemy import DDL, case, event, literal, select, union_all
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.pool import QueuePool
+import fast_json
+from build_assets import DIST_DIR, MANIFEST_FILE
+from import_menu import SAMPLE_MENU, read_catalog, upsert_menu_items
+from metrics import COUNT_BUCKETS, MetricsRegistry
+from migrations import ORDER_ITEM_TOTAL_TRIGGERS, create_menu_search_index, run_migrations
+from order_events import OrderEventBus, create_backend
+from password_hashing import HashingBusy, PasswordHasher
+from rate_limit import RateLimited, RateLimiter, create_store
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'dev-key-123'  # Change this in production
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///orders.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///orders.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Responses larger than this are gzip/brotli compressed for clients that
+# accept it; 0 disables compression (e.g. when a proxy already does it)
+app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+app.config['COMPRESS_MIMETYPES'] = {'application/json', 'application/x-ndjson', 'text/html', 'text/plain', 'text/csv'}
+app.config['COMPRESS_GZIP_LEVEL'] = 6
+app.config['COMPRESS_BROTLI_QUALITY'] = 5
+
+# SQLite performance profiles. 'prod' is tuned for several gunicorn workers
+# sharing orders.db: WAL so readers never wait for cart writers, a busy
+# timeout plus bounded retries instead of instant "database is locked"
+# errors, and a connection pool so pragmas are not re-applied per request.
+DATABASE_PROFILES = {
+    'dev': {
+        'pragmas': [
+            ('busy_timeout', 1000),
+        ],
+        'engine_options': {},
+        'lock_retries': 0,
+        'lock_retry_backoff': 0,
+    },
+    'prod': {
+        'pragmas': [
+            ('journal_mode', 'WAL'),
+            ('busy_timeout', 5000),
+            ('synchronous', 'NORMAL'),
+            ('cache_size', -20000),  # KiB, i.e. 20 MB per connection
+            ('mmap_size', 268435456),
+            ('temp_store', 'MEMORY'),
+        ],
+        'engine_options': {
+            # SQLite file databases otherwise get NullPool: a new connection,
+            # and a fresh round of pragmas, for every request
+            'poolclass': QueuePool,
+            'pool_size': 8,  # matches gunicorn threads per worker
+            'max_overflow': 4,
+            'pool_timeout': 10,
+            'connect_args': {'check_same_thread': False},
+        },
+        'lock_retries': 4,
+        'lock_retry_backoff': 0.05,
+    },
+}
+app.config['DATABASE_PROFILE'] = os.environ.get('DATABASE_PROFILE', 'prod')
+database_profile = DATABASE_PROFILES[app.config['DATABASE_PROFILE']]
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = database_profile['engine_options']
+app.config['SQLITE_PRAGMAS'] = database_profile['pragmas']
+app.config['SQLITE_LOCK_RETRIES'] = database_profile['lock_retries']
+app.config['SQLITE_LOCK_RETRY_BACKOFF'] = database_profile['lock_retry_backoff']
+# Shared runtime state (cache version stamps etc.) visible to every gunicorn worker
+app.config['MENU_CATALOG_VERSION_FILE'] = os.path.join(app.instance_path, 'menu_catalog.version')
+# 'sqlite' fans events out across gunicorn workers, 'local' keeps them in process
+app.config['ORDER_EVENTS_BACKEND'] = os.environ.get('ORDER_EVENTS_BACKEND', 'sqlite')
+app.config['ORDER_EVENTS_DB'] = os.path.join(app.instance_path, 'order_events.db')
+# Open /order_events streams per worker; each holds a gunicorn thread, so
+# keep this below gunicorn's threads. Further streams get a 503.
+app.config['ORDER_EVENTS_MAX_STREAMS'] = int(os.environ.get('ORDER_EVENTS_MAX_STREAMS', 24))
+app.config['CART_BATCH_MAX_OPERATIONS'] = 100
+app.config['MENU_SEARCH_PAGE_SIZE'] = 24
+app.config['MENU_SEARCH_MAX_PAGE_SIZE'] = 100
+app.config['ORDER_HISTORY_PAGE_SIZE'] = 20
+app.config['ORDER_HISTORY_MAX_PAGE_SIZE'] = 100
+# Rows fetched per round trip while streaming a receipt export
+app.config['RECEIPT_EXPORT_CHUNK_SIZE'] = 500
+# Active orders with no cart changes or joins for this long are expired and archived
+app.config['ORDER_IDLE_TIMEOUT'] = timedelta(hours=12)
+# Seconds between idle-order sweeps in each worker, 0 disables the sweeper
+app.config['ORDER_SWEEP_INTERVAL'] = int(os.environ.get('ORDER_SWEEP_INTERVAL', 300))
+# Per-worker metric snapshots merged by /metrics; set METRICS_TOKEN to
+# require "Authorization: Bearer <token>" on scrapes
+app.config['METRICS_DIR'] = os.path.join(app.instance_path, 'metrics')
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+app.config['SLOW_QUERY_THRESHOLD_MS'] = int(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 100))
+app.config['SLOW_REQUEST_THRESHOLD_MS'] = int(os.environ.get('SLOW_REQUEST_THRESHOLD_MS', 500))
+# Per-worker cache of logged-in user identities used by Flask-Login
+app.config['USER_CACHE_SIZE'] = 10000
+app.config['USER_CACHE_TTL'] = 60
+# Password hashing runs on a per-worker process pool. The method string
+# sets the cost; existing hashes are upgraded at the next successful login.
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:260000')
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+# Hashing jobs allowed to wait for the pool before signup/login return 503
+app.config['PASSWORD_HASH_MAX_PENDING'] = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 64))
+app.config['PASSWORD_HASH_TIMEOUT'] = 10
+# Token buckets on cart writes, per endpoint: (tokens per second, burst)
+# for each user and for each order. 'sqlite' shares the buckets across
+# gunicorn workers, 'local' keeps them per process, 'off' disables limits.
+app.config['RATE_LIMIT_BACKEND'] = os.environ.get('RATE_LIMIT_BACKEND', 'sqlite')
+app.config['RATE_LIMIT_DB'] = os.path.join(app.instance_path, 'rate_limits.db')
+app.config['RATE_LIMITS'] = {
+    'add_to_cart': {'user': (5, 20), 'order': (50, 200)},
+    'update_quantity': {'user': (5, 20), 'order': (50, 200)},
+    'remove_from_cart': {'user': (5, 20), 'order': (50, 200)},
+    'batch_update_cart': {'user': (2, 10), 'order': (20, 100)},
+}
 
 db = SQLAlchemy(app)
+
+def jsonify(*args, **kwargs):
+    """flask.jsonify, encoded with the fast JSON backend (see fast_json.py)."""
+    if args and kwargs:
+        raise TypeError('jsonify() behavior undefined when passed both args and kwargs')
+    data = args[0] if len(args) == 1 else (args or kwargs)
+    return app.response_class(fast_json.dumpb(data), mimetype=app.config['JSONIFY_MIMETYPE'])
+
+# SQLite connection setup
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in app.config['SQLITE_PRAGMAS']:
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+def _is_lock_error(error):
+    message = str(error).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+def _execute_with_lock_retry(cursor, statement, parameters, context):
+    # A write that times out waiting for the lock has not run, so it is safe
+    # to try again; pysqlite only opens the transaction at that first write
+    retries = app.config['SQLITE_LOCK_RETRIES']
+    for attempt in range(retries + 1):
+        try:
+            cursor.execute(statement, parameters)
+            return True
+        except sqlite3.OperationalError as e:
+            if attempt == retries or not _is_lock_error(e):
+                raise
+            time.sleep(app.config['SQLITE_LOCK_RETRY_BACKOFF'] * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+engine = db.get_engine(app)
+event.listen(engine, 'connect', _apply_sqlite_pragmas)
+if app.config['SQLITE_LOCK_RETRIES']:
+    event.listen(engine, 'do_execute', _execute_with_lock_retry)
+    event.listen(engine, 'do_execute_no_params', lambda cursor, statement, context: _execute_with_lock_retry(cursor, statement, (), context))
+
+password_hasher = PasswordHasher(
+    app.config['PASSWORD_HASH_METHOD'],
+    workers=app.config['PASSWORD_HASH_WORKERS'],
+    max_pending=app.config['PASSWORD_HASH_MAX_PENDING'],
+    timeout=app.config['PASSWORD_HASH_TIMEOUT']
+)
+
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
@@ -21,7 +187,8 @@ login_manager.login_view = 'login'
 # Association table for the many-to-many relationship between users and orders
 order_users = db.Table('order_users',
     db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
-    db.Column('order_id', db.Integer, db.ForeignKey('order.id'), primary_key=True)
+    db.Column('order_id', db.Integer, db.ForeignKey('order.id'), primary_key=True),
+    db.Index('ix_order_users_order_id', 'order_id')
 )
 
 class User(UserMixin, db.Model):
@@ -34,33 +201,70 @@ class User(UserMixin, db.Model):
                            backref=db.backref('users', lazy=True))
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return password_hasher.needs_rehash(self.password_hash)
 
 class MenuItem(db.Model):
+    __table_args__ = (
+        db.Index('uq_menu_item_name', 'name', unique=True),
+        db.Index('ix_menu_item_category', 'category', 'name'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), nullable=False)
     description = db.Column(db.String(200))
     price = db.Column(db.Float, nullable=False)
     category = db.Column(db.String(50), nullable=False)
 
+@event.listens_for(MenuItem.__table__, 'after_create')
+def _create_menu_search_index(target, connection, **kw):
+    # create_all gets the search index and its triggers, like migration 5
+    create_menu_search_index(connection.connection)
+
+@event.listens_for(MenuItem.__table__, 'before_drop')
+def _drop_menu_search_index(target, connection, **kw):
+    # Its rowids would point at whatever items reuse the ids
+    connection.exec_driver_sql('DROP TABLE IF EXISTS menu_item_fts')
+
 class Order(db.Model):
+    # AUTOINCREMENT so ids of archived orders are never handed out again
+    __table_args__ = (
+        db.Index('ix_order_status_created_at', 'status', 'created_at'),
+        db.Index('ix_order_status_last_activity_at', 'status', 'last_activity_at'),
+        {'sqlite_autoincrement': True}
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     pin = db.Column(db.String(4), unique=True, nullable=False)
     name = db.Column(db.String(80), nullable=False)
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(20), default='active')
+    # Set by every cart write and join; the idle sweeper goes by this
+    last_activity_at = db.Column(db.DateTime, default=datetime.utcnow)
     # Add relationship to order items
     items = db.relationship('OrderItem', backref='order', lazy=True)
 
 class OrderItem(db.Model):
+    # One line per member per menu item; add_to_cart upserts against this
+    __table_args__ = (
+        db.Index('uq_order_item_line', 'order_id', 'user_id', 'menu_item_id', unique=True),
+        db.Index('ix_order_item_menu_item_id', 'menu_item_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
     menu_item_id = db.Column(db.Integer, db.ForeignKey('menu_item.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # Name and unit price when the line was added, so carts and receipts
+    # need no menu join and menu edits don't reprice an open order
+    item_name = db.Column(db.String(80), nullable=False)
+    price = db.Column(db.Float, nullable=False)
     quantity = db.Column(db.Integer, default=1)
     added_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -68,20 +272,620 @@ class OrderItem(db.Model):
     user = db.relationship('User', backref='order_items')
     menu_item = db.relationship('MenuItem', backref='order_items')
 
+class OrderItemTotal(db.Model):
+    # Quantities summed per menu item across all members of an order, for
+    # placing the group order. Triggers on order_item keep it up to date.
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), primary_key=True)
+    menu_item_id = db.Column(db.Integer, db.ForeignKey('menu_item.id'), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False)
+    members = db.Column(db.Integer, nullable=False)
+    # Sum of quantity * price over the lines, at their snapshot prices
+    amount = db.Column(db.Float, nullable=False, server_default='0')
+
+for statement in ORDER_ITEM_TOTAL_TRIGGERS:
+    event.listen(OrderItem.__table__, 'after_create', DDL(statement))
+
+class CartRevision(db.Model):
+    # Bumped on every change to a member's cart; /cart uses it as its ETag
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    revision = db.Column(db.Integer, nullable=False, default=0)
+
+# Archive of closed/expired orders. Rows keep the original order id and a
+# snapshot of names and prices so receipts stay readable after the live
+# rows are gone.
+archived_order_users = db.Table('archived_order_users',
+    db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
+    db.Column('order_id', db.Integer, db.ForeignKey('archived_order.id'), primary_key=True),
+    db.Index('ix_archived_order_users_order_id', 'order_id')
+)
+
+class ArchivedOrder(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    pin = db.Column(db.String(4), nullable=False)
+    name = db.Column(db.String(80), nullable=False)
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime)
+    closed_at = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+
+class ArchivedOrderItem(db.Model):
+    __table_args__ = (
+        # Receipt exports stream an archived order's lines grouped by member
+        db.Index('ix_archived_order_item_order_user', 'order_id', 'user_id', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('archived_order.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_name = db.Column(db.String(80), nullable=False)
+    menu_item_id = db.Column(db.Integer, nullable=False)
+    item_name = db.Column(db.String(80), nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    added_at = db.Column(db.DateTime)
+
+class FreePin(db.Model):
+    # Shuffled pool of unused order PINs; the lowest slot is handed out next
+    # and released PINs go to the back of the queue
+    slot = db.Column(db.Integer, primary_key=True)
+    pin = db.Column(db.String(4), unique=True, nullable=False)
+
+# Menu catalog cache
+class MenuCatalogCache:
+    """Per-worker copy of the serialized /menu_items payload.
+
+    The catalog version is a token stored in a small file shared by all
+    workers. Any committed MenuItem write replaces the token, so every
+    worker rebuilds its copy on the next request instead of serving stale
+    data. Reading the token is a single small file read, no DB round trip.
+    """
+
+    def __init__(self, version_file):
+        self.version_file = version_file
+        self._lock = threading.Lock()
+        self._version = None
+        self._payload = None
+        self._etag = None
+
+    def current_version(self):
+        try:
+            with open(self.version_file) as f:
+                return f.read().strip() or '0'
+        except FileNotFoundError:
+            return '0'
+
+    def bump(self):
+        os.makedirs(os.path.dirname(self.version_file), exist_ok=True)
+        tmp_path = f"{self.version_file}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(uuid.uuid4().hex)
+        # Atomic rename so readers never see a half-written token
+        os.replace(tmp_path, self.version_file)
+
+    def get(self):
+        """Return (payload_bytes, etag) for the current catalog version."""
+        version = self.current_version()
+        if self._version == version and self._payload is not None:
+            return self._payload, self._etag
+
+        with self._lock:
+            if self._version == version and self._payload is not None:
+                return self._payload, self._etag
+
+            menu_items = [{
+                'id': item.id,
+                'name': item.name,
+                'description': item.description,
+                'price': item.price,
+                'category': item.category
+            } for item in MenuItem.query.order_by(MenuItem.id).all()]
+
+            payload = fast_json.dumpb({'menu_items': menu_items})
+            self._etag = hashlib.sha1(payload).hexdigest()
+            self._payload = payload
+            self._version = version
+            return self._payload, self._etag
+
+menu_catalog = MenuCatalogCache(app.config['MENU_CATALOG_VERSION_FILE'])
+
+@event.listens_for(db.session, 'after_flush')
+def _track_menu_writes(db_session, flush_context):
+    # Covers every MenuItem write, including the implicit inserts in add_to_cart
+    touched = list(db_session.new) + list(db_session.dirty) + list(db_session.deleted)
+    if any(isinstance(obj, MenuItem) for obj in touched):
+        db_session.info['menu_catalog_dirty'] = True
+
+@event.listens_for(db.session, 'after_commit')
+def _bump_menu_catalog(db_session):
+    if db_session.info.pop('menu_catalog_dirty', False):
+        menu_catalog.bump()
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_menu_writes(db_session):
+    db_session.info.pop('menu_catalog_dirty', None)
+
+# Live order room updates
+order_events = OrderEventBus(create_backend(
+    app.config['ORDER_EVENTS_BACKEND'],
+    path=app.config['ORDER_EVENTS_DB']
+), max_streams=app.config['ORDER_EVENTS_MAX_STREAMS'])
+
+def publish_member_event(order_id, event_type, user):
+    order_events.publish(order_id, event_type, {
+        'user': {'id': user.id, 'name': user.name}
+    })
+
+def cart_line(order_item, quantity):
+    return {
+        'id': order_item.menu_item_id,
+        'name': order_item.item_name,
+        'price': order_item.price,
+        'quantity': quantity
+    }
+
+def cart_event(user, order_item, quantity, revision=None):
+    # quantity 0 means the line was removed from the member's cart
+    data = {
+        'user': {'id': user.id, 'name': user.name},
+        'item': cart_line(order_item, quantity)
+    }
+    if revision is not None:
+        # Lets the member's other tabs skip reloading a cart they already have
+        data['revision'] = revision
+    return 'cart_item_removed' if quantity == 0 else 'cart_item_updated', data
+
+# User identity cache
+class CachedUser(UserMixin):
+    """What most routes need to know about the logged-in user.
+
+    Use load_current_user() when the full ORM User is required.
+    """
+
+    def __init__(self, id, name, email):
+        self.id = id
+        self.name = name
+        self.email = email
+
+class UserIdentityCache:
+    """Bounded LRU of CachedUser entries that expire after a TTL.
+
+    Entries are dropped locally when a User row changes. Other workers
+    pick up a changed name or email once their entry expires. The
+    password hash is never cached, so a password change takes effect in
+    every worker at once.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                return entry[1]
+
+        row = db.session.query(User.id, User.name, User.email).filter(User.id == user_id).first()
+        if row is None:
+            self.invalidate(user_id)
+            return None
+        return self.put(row)
+
+    def put(self, user):
+        identity = CachedUser(user.id, user.name, user.email)
+        with self._lock:
+            self._entries[user.id] = (time.monotonic() + self.ttl, identity)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return identity
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+user_identities = UserIdentityCache(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_user_identity(mapper, connection, target):
+    user_identities.invalidate(target.id)
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_identities.get(int(user_id))
+
+def load_current_user():
+    """Full ORM User for the logged-in user, loaded at most once per request."""
+    user = current_user._get_current_object()
+    if isinstance(user, User):
+        return user
+    if 'current_user_model' not in g:
+        g.current_user_model = User.query.get(user.id)
+    return g.current_user_model
+
+# PIN allocation
+class PinPoolExhausted(Exception):
+    pass
+
+def claim_pin():
+    """Take the next PIN from the free pool in constant time.
+
+    Runs inside the caller's transaction, so the PIN goes back to the pool
+    if creating the order is rolled back.
+    """
+    while True:
+        next_free = db.session.query(FreePin.slot, FreePin.pin).order_by(FreePin.slot).first()
+        if next_free is None:
+            raise PinPoolExhausted()
+
+        # Another worker may grab the same slot first; only one delete wins
+        claimed = FreePin.query.filter_by(slot=next_free.slot).delete(synchronize_session=False)
+        if claimed:
+            return next_free.pin
+
+def release_pin(connection, pin):
+    connection.execute(db.text(
+        'INSERT OR IGNORE INTO free_pin (slot, pin) '
+        'SELECT COALESCE(MAX(slot), 0) + 1, :pin FROM free_pin'
+    ), {'pin': pin})
+
+@event.listens_for(Order, 'after_delete')
+def _release_order_pin(mapper, connection, target):
+    # Once the order row is gone its PIN can be handed out again
+    release_pin(connection, target.pin)
+
+# Order lifecycle: active -> closed (by its creator) or expired (idle sweeper)
+def archive_order(order_id, status):
+    """Move an order, its lines and memberships into the archive tables.
+
+    Runs in the caller's transaction. Returns False if the order is no
+    longer live, e.g. another worker archived it first.
+    """
+    order = Order.query.get(order_id)
+    if order is None:
+        return False
+
+    db.session.execute(ArchivedOrder.__table__.insert().values(
+        id=order.id,
+        pin=order.pin,
+        name=order.name,
+        created_by=order.created_by,
+        created_at=order.created_at,
+        closed_at=datetime.utcnow(),
+        status=status
+    ))
+    db.session.execute(ArchivedOrderItem.__table__.insert().from_select(
+        ['order_id', 'user_id', 'user_name', 'menu_item_id', 'item_name', 'price', 'quantity', 'added_at'],
+        select(
+            OrderItem.order_id, OrderItem.user_id, User.name, OrderItem.menu_item_id,
+            OrderItem.item_name, OrderItem.price, OrderItem.quantity, OrderItem.added_at
+        ).join(
+            User, OrderItem.user_id == User.id
+        ).where(
+            OrderItem.order_id == order_id
+        ).order_by(OrderItem.id)
+    ))
+    db.session.execute(archived_order_users.insert().from_select(
+        ['user_id', 'order_id'],
+        select(order_users.c.user_id, order_users.c.order_id).where(order_users.c.order_id == order_id)
+    ))
+
+    db.session.execute(OrderItem.__table__.delete().where(OrderItem.order_id == order_id))
+    db.session.execute(CartRevision.__table__.delete().where(CartRevision.order_id == order_id))
+    db.session.execute(order_users.delete().where(order_users.c.order_id == order_id))
+    db.session.execute(Order.__table__.delete().where(Order.id == order_id))
+    # Core deletes skip the mapper hook, so hand the PIN back explicitly
+    release_pin(db.session.connection(), order.pin)
+    db.session.expunge(order)
+    return True
+
+def touch_order(order_id):
+    """Record activity on a live order, in the caller's transaction.
+
+    Returns False if the order has been closed or expired. Make this the
+    first write of a cart change: it takes SQLite's write lock, so the
+    order cannot be archived before the change commits.
+    """
+    return db.session.execute(Order.__table__.update().where(
+        Order.id == order_id,
+        Order.status == 'active'
+    ).values(last_activity_at=datetime.utcnow())).rowcount > 0
+
+def order_gone_response():
+    db.session.rollback()
+    session.pop('current_order_id', None)
+    return jsonify({
+        'success': False,
+        'message': 'This order has been closed',
+        'order_closed': True
+    }), 409
+
+def sweep_idle_orders():
+    """Expire and archive active orders that have gone idle."""
+    cutoff = datetime.utcnow() - app.config['ORDER_IDLE_TIMEOUT']
+    idle_ids = [order_id for order_id, in db.session.query(Order.id).filter(
+        Order.status == 'active',
+        Order.last_activity_at < cutoff
+    )]
 
-def generate_pin():
+    expired = 0
+    for order_id in idle_ids:
+        try:
+            # Check again under the write lock; a member may have just
+            # added something
+            still_idle = db.session.execute(Order.__table__.update().where(
+                Order.id == order_id,
+                Order.status == 'active',
+                Order.last_activity_at < cutoff
+            ).values(status='expired')).rowcount
+            if not still_idle:
+                db.session.rollback()
+                continue
+            if archive_order(order_id, 'expired'):
+                db.session.commit()
+                order_events.publish(order_id, 'order_closed', {'status': 'expired'})
+                expired += 1
+        except IntegrityError:
+            # Already archived by a sweeper in another worker
+            db.session.rollback()
+    return expired
+
+def run_order_sweeper(interval):
     while True:
-        pin = ''.join(random.choices(string.digits, k=4))
-        if not Order.query.filter_by(pin=pin).first():
-            return pin
+        time.sleep(interval)
+        try:
+            with app.app_context():
+                expired = sweep_idle_orders()
+                if expired:
+                    print(f"Archived {expired} idle orders")
+        except Exception as e:
+            print(f"Error sweeping idle orders: {str(e)}")
+
+@app.before_first_request
+def start_order_sweeper():
+    interval = app.config['ORDER_SWEEP_INTERVAL']
+    if interval > 0:
+        threading.Thread(target=run_order_sweeper, args=(interval,), name='order-sweeper', daemon=True).start()
+
+@app.cli.command('sweep-orders')
+def sweep_orders_command():
+    """Expire and archive idle orders once (for cron)."""
+    print(f"Archived {sweep_idle_orders()} idle orders")
+
+def seed_pin_pool():
+    """Fill an empty pool with every 4-digit PIN not held by an order."""
+    if FreePin.query.first() is not None:
+        return
+
+    used = {pin for pin, in db.session.query(Order.pin)}
+    free = [f'{n:04d}' for n in range(10000) if f'{n:04d}' not in used]
+    random.shuffle(free)
+
+    # OR IGNORE: several workers may seed at the same time on first boot
+    db.session.execute(
+        FreePin.__table__.insert().prefix_with('OR IGNORE'),
+        [{'slot': slot, 'pin': pin} for slot, pin in enumerate(free, start=1)]
+    )
+    db.session.commit()
+
+# Request instrumentation
+metrics = MetricsRegistry(app.config['METRICS_DIR'])
+metrics.histogram('http_request_duration_seconds', 'Time spent handling a request, by route.')
+metrics.counter('http_requests_total', 'Requests handled, by route and status code.')
+metrics.histogram('db_statements_per_request', 'SQL statements issued while handling one request, by route.', COUNT_BUCKETS)
+metrics.counter('db_statements_total', 'SQL statements executed, by route.')
+metrics.counter('db_statement_seconds_total', 'Time spent executing SQL statements, by route.')
+metrics.counter('db_slow_statements_total', 'SQL statements slower than SLOW_QUERY_THRESHOLD_MS, by route.')
+metrics.counter('password_hash_rejected_total', 'Signups and logins turned away because the hashing pool was full, by route.')
+metrics.counter('rate_limited_total', 'Requests turned away with 429 by a rate limit, by route and bucket scope.')
+metrics.counter('order_event_streams_rejected_total', 'SSE streams refused with 503 because the per-worker cap was reached.')
+
+def current_route():
+    if not has_request_context():
+        return 'background'
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+@event.listens_for(engine, 'before_cursor_execute')
+def _start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.statement_start = time.perf_counter()
+
+@event.listens_for(engine, 'after_cursor_execute')
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, 'statement_start', None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    route = current_route()
+
+    if has_request_context():
+        g.sql_count = g.get('sql_count', 0) + 1
+        g.sql_time = g.get('sql_time', 0.0) + elapsed
+    metrics.inc('db_statements_total', {'route': route})
+    metrics.inc('db_statement_seconds_total', {'route': route}, elapsed)
+
+    if elapsed * 1000 >= app.config['SLOW_QUERY_THRESHOLD_MS']:
+        metrics.inc('db_slow_statements_total', {'route': route})
+        app.logger.warning('Slow query (%.1f ms) in %s: %s', elapsed * 1000, route, ' '.join(statement.split())[:500])
+
+@app.before_request
+def _start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def _record_request(response):
+    start = g.get('request_start')
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    route = current_route()
+    sql_count = g.get('sql_count', 0)
+    sql_time = g.get('sql_time', 0.0)
+
+    labels = {'route': route, 'method': request.method}
+    metrics.observe('http_request_duration_seconds', labels, elapsed)
+    metrics.inc('http_requests_total', dict(labels, status=str(response.status_code)))
+    metrics.observe('db_statements_per_request', labels, sql_count)
+    metrics.maybe_flush()
+
+    if elapsed * 1000 >= app.config['SLOW_REQUEST_THRESHOLD_MS']:
+        app.logger.warning('Slow request (%.1f ms) %s %s: %d SQL statements (%.1f ms)',
+                           elapsed * 1000, request.method, route, sql_count, sql_time * 1000)
+
+    response.headers['Server-Timing'] = (
+        f'app;dur={elapsed * 1000:.1f}, db;dur={sql_time * 1000:.1f};desc="{sql_count} queries"'
+    )
+    return response
+
+# Response compression
+def negotiate_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+@app.after_request
+def compress_response(response):
+    min_size = app.config['COMPRESS_MIN_SIZE']
+    if (not min_size
+            or response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in app.config['COMPRESS_MIMETYPES']):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    encoding = negotiate_encoding()
+    if encoding is None or len(body) < min_size:
+        return response
+
+    if encoding == 'br':
+        compressed = brotli.compress(body, quality=app.config['COMPRESS_BROTLI_QUALITY'])
+    else:
+        compressed = gzip.compress(body, compresslevel=app.config['COMPRESS_GZIP_LEVEL'])
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+
+    # Different bytes per encoding: downgrade the ETag to a weak validator,
+    # which If-None-Match still matches (handlers compare with contains_weak)
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    token = app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# Rate limiting
+rate_limiter = None
+if app.config['RATE_LIMIT_BACKEND'] != 'off':
+    rate_limiter = RateLimiter(create_store(
+        app.config['RATE_LIMIT_BACKEND'],
+        path=app.config['RATE_LIMIT_DB']
+    ))
+
+def rate_limited(view):
+    """Take a token from the RATE_LIMITS buckets of this endpoint first.
+
+    Goes below @login_required. Over the limit, RateLimited is raised
+    before the view touches the database.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        limits = app.config['RATE_LIMITS'].get(request.endpoint)
+        if rate_limiter is not None and limits:
+            buckets = []
+            if 'user' in limits:
+                buckets.append(('user', f'{request.endpoint}:user:{current_user.id}', *limits['user']))
+            order_id = session.get('current_order_id')
+            if 'order' in limits and order_id:
+                buckets.append(('order', f'{request.endpoint}:order:{order_id}', *limits['order']))
+            rate_limiter.check(buckets)
+        return view(*args, **kwargs)
+    return wrapper
+
+@app.errorhandler(RateLimited)
+def rate_limit_exceeded(error):
+    metrics.inc('rate_limited_total', {'route': current_route(), 'scope': error.scope})
+    return jsonify({
+        'success': False,
+        'message': 'Too many cart updates, please slow down'
+    }), 429, {'Retry-After': str(max(1, math.ceil(error.retry_after)))}
 
 # Routes
+# Static assets
+class AssetManifest:
+    """Maps static paths to the fingerprinted names made by build_assets.py.
+
+    Re-read when the manifest file changes, so a rebuild is picked up
+    without restarting the workers.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._mtime = None
+        self._assets = {}
+
+    def get(self, filename):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return None
+        if mtime != self._mtime:
+            with open(self.path) as f:
+                self._assets = json.load(f)
+            self._mtime = mtime
+        return self._assets.get(filename)
+
+asset_manifest = AssetManifest(MANIFEST_FILE)
+
+@app.template_global()
+def asset_url(filename):
+    # Unbuilt assets (e.g. under the dev server) are served as they are
+    hashed = asset_manifest.get(filename)
+    if hashed is None:
+        return url_for('static', filename=filename)
+    return url_for('static_asset', filename=hashed)
+
+@app.route('/assets/<path:filename>')
+def static_asset(filename):
+    # Serve the precompressed copy the client accepts, if there is one
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[encoding] and os.path.isfile(os.path.join(DIST_DIR, filename + suffix)):
+            response = send_from_directory(
+                DIST_DIR, filename + suffix,
+                mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            )
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(DIST_DIR, filename)
+
+    # Hashed names never change content, so browsers never need to ask again
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.vary.add('Accept-Encoding')
+    return response
+
 @app.route('/')
 def index():
-    return render_template('index.html')
+    response = app.make_response(render_template('index.html'))
+    # The page is small; always revalidate it so new asset URLs are seen
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/signup', methods=['POST'])
 def signup():
@@ -115,6 +919,7 @@ def signup():
             
             # Log the user in
             login_user(new_user)
+            user_identities.put(new_user)
             
             return jsonify({
                 'success': True,
@@ -133,6 +938,13 @@ def signup():
                 'message': 'Database error occurred'
             }), 500
 
+    except HashingBusy:
+        db.session.rollback()
+        metrics.inc('password_hash_rejected_total', {'route': current_route()})
+        return jsonify({
+            'success': False,
+            'message': 'Server is busy, please try again'
+        }), 503, {'Retry-After': '1'}
     except Exception as e:
         print(f"Error during signup: {str(e)}")
         return jsonify({
@@ -155,7 +967,17 @@ def login():
 
         user = User.query.filter_by(email=email).first()
         if user and user.check_password(password):
+            # Upgrade hashes made with an older method or cost
+            if user.password_needs_rehash():
+                try:
+                    user.set_password(password)
+                    db.session.commit()
+                except (HashingBusy, SQLAlchemyError) as e:
+                    db.session.rollback()
+                    print(f"Error rehashing password: {str(e)}")
+
             login_user(user)
+            user_identities.put(user)
             return jsonify({
                 'success': True,
                 'message': 'Login successful',
@@ -171,6 +993,13 @@ def login():
                 'message': 'Invalid email or password'
             }), 401
 
+    except HashingBusy:
+        db.session.rollback()
+        metrics.inc('password_hash_rejected_total', {'route': current_route()})
+        return jsonify({
+            'success': False,
+            'message': 'Server is busy, please try again'
+        }), 503, {'Retry-After': '1'}
     except Exception as e:
         print(f"Error during login: {str(e)}")
         return jsonify({
@@ -205,7 +1034,7 @@ def create_order():
             }), 400
             
         # Create new order
-        pin = generate_pin()
+        pin = claim_pin()
         new_order = Order(
             name=order_name,
             pin=pin,
@@ -213,7 +1042,7 @@ def create_order():
         )
         
         # Add creator to the order's users
-        new_order.users.append(current_user)
+        new_order.users.append(load_current_user())
         
         db.session.add(new_order)
         db.session.commit()
@@ -225,11 +1054,18 @@ def create_order():
             'success': True,
             'message': 'Order created successfully',
             'order': {
+                'id': new_order.id,
                 'name': new_order.name,
                 'pin': new_order.pin
             }
         })
         
+    except PinPoolExhausted:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': 'No order PINs available, please try again later'
+        }), 503
     except Exception as e:
         db.session.rollback()
         print(f"Error creating order: {str(e)}")
@@ -260,30 +1096,41 @@ def join_order():
             }), 404
             
         # Check if user is already in the order
-        if current_user in order.users:
+        if is_order_member(order_users, order.id, current_user.id):
             # If user is already in the order, just set the session
             session['current_order_id'] = order.id
             return jsonify({
                 'success': True,
                 'message': 'Rejoined order successfully',
                 'order': {
+                    'id': order.id,
                     'name': order.name,
                     'pin': order.pin
                 }
             })
             
-        # Add user to order
-        order.users.append(current_user)
+        # Closed since we looked it up: joining it would orphan the membership
+        if not touch_order(order.id):
+            db.session.rollback()
+            return jsonify({
+                'success': False,
+                'message': 'Order not found'
+            }), 404
+
+        # Add user to order without loading every existing member
+        db.session.execute(order_users.insert().values(user_id=current_user.id, order_id=order.id))
         
         # Set the current order in session
         session['current_order_id'] = order.id
         
         db.session.commit()
+        publish_member_event(order.id, 'member_joined', current_user)
         
         return jsonify({
             'success': True,
             'message': 'Joined order successfully',
             'order': {
+                'id': order.id,
                 'name': order.name,
                 'pin': order.pin
             }
@@ -307,10 +1154,13 @@ def join_order():
 def check_auth():
     if current_user.is_authenticated:
         # Get user's active order if any
-        active_order = None
-        active_orders = current_user.orders.filter_by(status='active').all()
-        if active_orders:
-            active_order = active_orders[0]
+        active_order = Order.query.join(
+            order_users, order_users.c.order_id == Order.id
+        ).filter(
+            order_users.c.user_id == current_user.id,
+            Order.status == 'active'
+        ).first()
+        if active_order:
             active_order_data = {
                 'id': active_order.id,
                 'name': active_order.name,
@@ -330,23 +1180,143 @@ def check_auth():
         })
     return jsonify({'authenticated': False}), 401
 
+ORDER_STATUSES = ('active', 'closed', 'expired')
+
+def order_history_page(user_id, statuses, before_id, limit):
+    """One page of a member's live and archived orders, newest first.
+
+    Order ids are AUTOINCREMENT and assigned in creation order, so ordering
+    by id is ordering by (created_at, id). Each branch seeks straight into
+    the membership primary key (user_id, order_id) below the cursor and
+    stops after limit + 1 rows. A page costs the same however many orders
+    the user has.
+    """
+    branches = []
+    if 'active' in statuses:
+        live = select(
+            Order.id, Order.name, Order.pin, Order.status, Order.created_by,
+            Order.created_at, literal(None, db.DateTime).label('closed_at'), literal(False).label('archived')
+        ).join(
+            order_users, order_users.c.order_id == Order.id
+        ).where(
+            order_users.c.user_id == user_id,
+            Order.status.in_(statuses)
+        )
+        if before_id:
+            live = live.where(order_users.c.order_id < before_id)
+        branches.append(live.order_by(order_users.c.order_id.desc()).limit(limit + 1))
+
+    archived_statuses = [status for status in statuses if status != 'active']
+    if archived_statuses:
+        archived = select(
+            ArchivedOrder.id, ArchivedOrder.name, ArchivedOrder.pin, ArchivedOrder.status,
+            ArchivedOrder.created_by, ArchivedOrder.created_at, ArchivedOrder.closed_at,
+            literal(True).label('archived')
+        ).join(
+            archived_order_users, archived_order_users.c.order_id == ArchivedOrder.id
+        ).where(
+            archived_order_users.c.user_id == user_id,
+            ArchivedOrder.status.in_(archived_statuses)
+        )
+        if before_id:
+            archived = archived.where(archived_order_users.c.order_id < before_id)
+        branches.append(archived.order_by(archived_order_users.c.order_id.desc()).limit(limit + 1))
+
+    # SQLite only allows ORDER BY/LIMIT on compound members inside subqueries
+    merged = union_all(*[select(branch.subquery()) for branch in branches]).subquery()
+    rows = db.session.execute(
+        select(merged).order_by(merged.c.id.desc()).limit(limit + 1)
+    ).all()
+    return rows[:limit], len(rows) > limit
+
+def order_history_totals(line_table, order_ids, user_id):
+    """Item count, order total and the user's own total per order, in SQL."""
+    if not order_ids:
+        return {}
+    amount = line_table.c.quantity * line_table.c.price
+    stmt = select(
+        line_table.c.order_id,
+        db.func.sum(line_table.c.quantity).label('item_count'),
+        db.func.sum(amount).label('total'),
+        db.func.sum(case((line_table.c.user_id == user_id, amount), else_=0)).label('my_total')
+    ).where(
+        line_table.c.order_id.in_(order_ids)
+    ).group_by(line_table.c.order_id)
+    return {row.order_id: row for row in db.session.execute(stmt)}
+
+@app.route('/orders', methods=['GET'])
+@login_required
+def order_history():
+    """Orders the user belongs or belonged to, newest first.
+
+    ?status=active,closed,expired filters by status, ?limit= sets the page
+    size and ?cursor= takes the next_cursor of the previous page.
+    """
+    try:
+        statuses = request.args.get('status')
+        statuses = [status.strip() for status in statuses.split(',')] if statuses else list(ORDER_STATUSES)
+        if not statuses or any(status not in ORDER_STATUSES for status in statuses):
+            return jsonify({
+                'success': False,
+                'message': 'Status must be one of active, closed, expired'
+            }), 400
+
+        limit = request.args.get('limit', app.config['ORDER_HISTORY_PAGE_SIZE'], type=int)
+        limit = max(1, min(limit, app.config['ORDER_HISTORY_MAX_PAGE_SIZE']))
+        before_id = request.args.get('cursor', type=int)
+
+        rows, has_more = order_history_page(current_user.id, statuses, before_id, limit)
+
+        live_totals = order_history_totals(
+            OrderItem.__table__, [row.id for row in rows if not row.archived], current_user.id
+        )
+        archived_totals = order_history_totals(
+            ArchivedOrderItem.__table__, [row.id for row in rows if row.archived], current_user.id
+        )
+
+        orders = []
+        for row in rows:
+            totals = (archived_totals if row.archived else live_totals).get(row.id)
+            orders.append({
+                'id': row.id,
+                'name': row.name,
+                'pin': row.pin,
+                'status': row.status,
+                'is_creator': row.created_by == current_user.id,
+                'created_at': row.created_at.isoformat() if row.created_at else None,
+                'closed_at': row.closed_at.isoformat() if row.closed_at else None,
+                'item_count': totals.item_count if totals else 0,
+                'total': totals.total if totals else 0,
+                'my_total': totals.my_total if totals else 0
+            })
+
+        return jsonify({
+            'success': True,
+            'orders': orders,
+            'next_cursor': rows[-1].id if has_more else None
+        })
+
+    except Exception as e:
+        print(f"Error loading order history: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Failed to load order history'
+        }), 500
+
 @app.route('/menu_items')
 @login_required
 def get_menu_items():
     try:
-        items = MenuItem.query.all()
-        menu_items = []
-        
-        for item in items:
-            menu_items.append({
-                'id': item.id,
-                'name': item.name,
-                'description': item.description,
-                'price': item.price,
-                'category': item.category
-            })
-        
-        return jsonify({'menu_items': menu_items})
+        payload, etag = menu_catalog.get()
+
+        # Clients that already hold this catalog version get an empty 304
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            response = Response(payload, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
     except Exception as e:
         print(f"Error fetching menu items: {str(e)}")
         return jsonify({
@@ -354,6 +1324,216 @@ def get_menu_items():
             'message': 'Failed to load menu items'
         }), 500
 
+def menu_response(payload_fn, etag):
+    # Menu reads revalidate against the catalog version, like /menu_items
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(payload_fn())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def menu_search_has_fts():
+    # Migration 5 skips the FTS5 table on SQLite builds without FTS5
+    return db.session.execute(db.text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'menu_item_fts'"
+    )).first() is not None
+
+def fts_match_query(text):
+    """Turn free text into an FTS5 query: every word, as a prefix."""
+    terms = [term.replace('"', '""') for term in text.split()]
+    return ' '.join(f'"{term}"*' for term in terms if term.strip('"'))
+
+def search_menu_items(query, category, limit, offset):
+    columns = 'menu_item.id, menu_item.name, menu_item.description, menu_item.price, menu_item.category'
+    params = {'category': category, 'limit': limit, 'offset': offset}
+    category_filter = 'AND menu_item.category = :category' if category else ''
+
+    match = fts_match_query(query) if query else ''
+    if match and menu_search_has_fts():
+        # bm25 ranks name matches ten times higher than description matches
+        sql = f"""SELECT {columns} FROM menu_item_fts
+                  JOIN menu_item ON menu_item.id = menu_item_fts.rowid
+                  WHERE menu_item_fts MATCH :match {category_filter}
+                  ORDER BY bm25(menu_item_fts, 10.0, 1.0), menu_item.id
+                  LIMIT :limit OFFSET :offset"""
+        params['match'] = match
+    elif match:
+        sql = f"""SELECT {columns} FROM menu_item
+                  WHERE (menu_item.name LIKE :like ESCAPE '\\' OR menu_item.description LIKE :like ESCAPE '\\')
+                  {category_filter}
+                  ORDER BY menu_item.name LIMIT :limit OFFSET :offset"""
+        escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        params['like'] = f'%{escaped}%'
+    else:
+        # Browsing: served in order by ix_menu_item_category
+        sql = f"""SELECT {columns} FROM menu_item
+                  WHERE 1 = 1 {category_filter}
+                  ORDER BY menu_item.category, menu_item.name
+                  LIMIT :limit OFFSET :offset"""
+    return db.session.execute(db.text(sql), params).all()
+
+@app.route('/menu_items/search')
+@login_required
+def menu_search():
+    """One page of menu items.
+
+    ?q= ranks matches on name and description by relevance, ?category=
+    filters, ?page= and ?per_page= paginate. Without q items are listed by
+    category and name.
+    """
+    try:
+        query = (request.args.get('q') or '').strip()[:100]
+        category = (request.args.get('category') or '').strip() or None
+        page = max(1, request.args.get('page', 1, type=int))
+        per_page = request.args.get('per_page', app.config['MENU_SEARCH_PAGE_SIZE'], type=int)
+        per_page = max(1, min(per_page, app.config['MENU_SEARCH_MAX_PAGE_SIZE']))
+
+        def payload():
+            rows = search_menu_items(query, category, per_page + 1, (page - 1) * per_page)
+            return {
+                'menu_items': [{
+                    'id': row.id,
+                    'name': row.name,
+                    'description': row.description,
+                    'price': row.price,
+                    'category': row.category
+                } for row in rows[:per_page]],
+                'page': page,
+                'per_page': per_page,
+                'has_more': len(rows) > per_page
+            }
+
+        key = f'{menu_catalog.current_version()}|{query}|{category}|{page}|{per_page}'
+        return menu_response(payload, hashlib.sha1(key.encode('utf-8')).hexdigest())
+    except Exception as e:
+        print(f"Error searching menu items: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Failed to search menu items'
+        }), 500
+
+@app.route('/menu_categories')
+@login_required
+def get_menu_categories():
+    try:
+        def payload():
+            rows = db.session.query(
+                MenuItem.category, db.func.count(MenuItem.id)
+            ).group_by(MenuItem.category).order_by(MenuItem.category).all()
+            return {'categories': [{'name': name, 'count': count} for name, count in rows]}
+
+        return menu_response(payload, f'categories-{menu_catalog.current_version()}')
+    except Exception as e:
+        print(f"Error fetching menu categories: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Failed to load menu categories'
+        }), 500
+
+def is_order_member(membership_table, order_id, user_id):
+    return db.session.query(membership_table.c.user_id).filter(
+        membership_table.c.order_id == order_id,
+        membership_table.c.user_id == user_id
+    ).first() is not None
+
+def find_or_create_menu_item(name, price):
+    menu_item = MenuItem.query.filter_by(name=name).first()
+    if menu_item:
+        return menu_item
+
+    # Another worker may insert the same name concurrently; the unique
+    # index turns that race into a no-op instead of a duplicate row
+    result = db.session.execute(
+        sqlite_insert(MenuItem.__table__).values(
+            name=name,
+            price=price,
+            category='Other'
+        ).on_conflict_do_nothing(index_elements=['name'])
+    )
+    if result.rowcount:
+        # Core inserts bypass the ORM flush hook that invalidates the catalog
+        db.session.info['menu_catalog_dirty'] = True
+    return MenuItem.query.filter_by(name=name).one()
+
+def upsert_cart_line(order_id, user_id, menu_item, quantity=1):
+    """Insert a cart line or add to its quantity in a single statement.
+
+    A new line snapshots the item's current name and price; adding to an
+    existing line keeps the price it was first added at.
+    """
+    stmt = sqlite_insert(OrderItem.__table__).values(
+        order_id=order_id,
+        user_id=user_id,
+        menu_item_id=menu_item.id,
+        item_name=menu_item.name,
+        price=menu_item.price,
+        quantity=quantity
+    )
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['order_id', 'user_id', 'menu_item_id'],
+        set_={'quantity': OrderItem.__table__.c.quantity + stmt.excluded.quantity}
+    ))
+
+def bump_cart_revision(order_id, user_id):
+    """Increment a member's cart revision in the caller's transaction."""
+    return db.session.execute(db.text(
+        'INSERT INTO cart_revision (order_id, user_id, revision) VALUES (:order_id, :user_id, 1) '
+        'ON CONFLICT (order_id, user_id) DO UPDATE SET revision = revision + 1 '
+        'RETURNING revision'
+    ), {'order_id': order_id, 'user_id': user_id}).scalar()
+
+def get_cart_revision(order_id, user_id):
+    return db.session.query(CartRevision.revision).filter_by(
+        order_id=order_id,
+        user_id=user_id
+    ).scalar() or 0
+
+def load_cart(order_id, user_id):
+    cart_items = OrderItem.query.filter(
+        OrderItem.order_id == order_id,
+        OrderItem.user_id == user_id
+    ).order_by(OrderItem.id).all()
+
+    items = [cart_line(item, item.quantity) for item in cart_items]
+    total = sum(item['price'] * item['quantity'] for item in items)
+    return items, total
+
+def cart_total(order_id, user_id):
+    return db.session.query(
+        db.func.sum(OrderItem.price * OrderItem.quantity)
+    ).filter(
+        OrderItem.order_id == order_id,
+        OrderItem.user_id == user_id
+    ).scalar() or 0
+
+def cart_update_response(message, order_id, revision, changed):
+    """Response body for a cart mutation.
+
+    With ?delta=1 only the changed lines (quantity 0 for removed ones) are
+    returned along with the new revision and total. Otherwise the whole
+    cart is returned as before. Call it before committing, so the lines
+    are still loaded and the body matches the revision.
+    """
+    if request.args.get('delta') == '1':
+        return {
+            'success': True,
+            'message': message,
+            'items': [cart_line(order_item, quantity) for order_item, quantity in changed],
+            'revision': revision,
+            'total': cart_total(order_id, current_user.id)
+        }
+
+    items, total = load_cart(order_id, current_user.id)
+    return {
+        'success': True,
+        'message': message,
+        'cart_items': items,
+        'revision': revision,
+        'total': total
+    }
+
 @app.route('/cart')
 @login_required
 def get_cart():
@@ -364,32 +1544,27 @@ def get_cart():
             'items': [],
             'total': 0
         })
-    
-    cart_items = db.session.query(
-        OrderItem, MenuItem
-    ).join(
-        MenuItem, OrderItem.menu_item_id == MenuItem.id
-    ).filter(
-        OrderItem.order_id == order_id,
-        OrderItem.user_id == current_user.id
-    ).all()
-    
-    items = [{
-        'id': item.MenuItem.id,
-        'name': item.MenuItem.name,
-        'price': item.MenuItem.price,
-        'quantity': item.OrderItem.quantity
-    } for item in cart_items]
-    
-    total = sum(item['price'] * item['quantity'] for item in items)
-    
-    return jsonify({
-        'items': items,
-        'total': total
-    })
+
+    # The revision changes with every cart edit, and lines carry their own
+    # name and price, so a matching ETag means the client's copy is current
+    revision = get_cart_revision(order_id, current_user.id)
+    etag = f'{order_id}-{current_user.id}-{revision}'
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        items, total = load_cart(order_id, current_user.id)
+        response = jsonify({
+            'items': items,
+            'total': total,
+            'revision': revision
+        })
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 @app.route('/add_to_cart', methods=['POST'])
 @login_required
+@rate_limited
 def add_to_cart():
     try:
         data = request.get_json()
@@ -409,43 +1584,27 @@ def add_to_cart():
                 'success': False,
                 'message': 'No active order'
             })
-            
-        # Find or create menu item
-        menu_item = MenuItem.query.filter_by(name=item_name).first()
-        if not menu_item:
-            menu_item = MenuItem(name=item_name, price=price)
-            db.session.add(menu_item)
-            db.session.flush()
+
+        if not touch_order(order_id):
+            return order_gone_response()
+
+        menu_item = find_or_create_menu_item(item_name, price)
         
-        # Check if item already in cart
+        # Create the line or increment it if already in cart
+        upsert_cart_line(order_id, current_user.id, menu_item)
+        revision = bump_cart_revision(order_id, current_user.id)
         order_item = OrderItem.query.filter_by(
             order_id=order_id,
             user_id=current_user.id,
             menu_item_id=menu_item.id
-        ).first()
-        
-        if order_item:
-            # Increment quantity if already exists
-            order_item.quantity += 1
-        else:
-            # Create new order item
-            order_item = OrderItem(
-                order_id=order_id,
-                user_id=current_user.id,
-                menu_item_id=menu_item.id,
-                quantity=1
-            )
-            db.session.add(order_item)
-        
+        ).populate_existing().one()
+
+        body = cart_update_response('Item added to cart', order_id, revision, [(order_item, order_item.quantity)])
+        event = cart_event(current_user, order_item, order_item.quantity, revision)
         db.session.commit()
-        
-        # Get updated cart
-        cart = get_cart()
-        return jsonify({
-            'success': True,
-            'message': 'Item added to cart',
-            'cart_items': cart.json['items']
-        })
+
+        order_events.publish(order_id, *event)
+        return jsonify(body)
         
     except Exception as e:
         db.session.rollback()
@@ -457,6 +1616,7 @@ def add_to_cart():
 
 @app.route('/remove_from_cart', methods=['POST'])
 @login_required
+@rate_limited
 def remove_from_cart():
     data = request.get_json()
     item_name = data.get('item_name')
@@ -469,27 +1629,32 @@ def remove_from_cart():
         order_id = session.get('current_order_id')
         if not order_id:
             return jsonify({'success': False, 'message': 'No active order'})
-        
+
+        if not touch_order(order_id):
+            return order_gone_response()
+
         # Find the order item
         order_item = OrderItem.query.filter_by(
             order_id=order_id,
-            user_id=current_user.id
-        ).join(MenuItem).filter(MenuItem.name == item_name).first()
+            user_id=current_user.id,
+            item_name=item_name
+        ).first()
         
         if not order_item:
+            db.session.rollback()
             return jsonify({'success': False, 'message': 'Item not found in cart'})
         
         # Remove the item
         db.session.delete(order_item)
+        db.session.flush()
+        revision = bump_cart_revision(order_id, current_user.id)
+
+        body = cart_update_response('Item removed successfully', order_id, revision, [(order_item, 0)])
+        event = cart_event(current_user, order_item, 0, revision)
         db.session.commit()
-        
-        # Get updated cart
-        cart = get_cart()
-        return jsonify({
-            'success': True,
-            'message': 'Item removed successfully',
-            'cart_items': cart.json['items']
-        })
+
+        order_events.publish(order_id, *event)
+        return jsonify(body)
         
     except Exception as e:
         db.session.rollback()
@@ -507,7 +1672,7 @@ def leave_order():
         # Get the order
         order = Order.query.get(order_id)
         if not order:
-            return jsonify({'success': False, 'message': 'Order not found'})
+            return order_gone_response()
             
         # Remove all cart items for this user in this order
         OrderItem.query.filter_by(
@@ -515,14 +1680,20 @@ def leave_order():
             user_id=current_user.id
         ).delete()
         
+        # Keep the revision moving so a later rejoin never reuses an old ETag
+        bump_cart_revision(order_id, current_user.id)
+
         # Remove user from order
-        if current_user in order.users:
-            order.users.remove(current_user)
+        db.session.execute(order_users.delete().where(
+            order_users.c.order_id == order_id,
+            order_users.c.user_id == current_user.id
+        ))
             
         # Clear session order ID
         session.pop('current_order_id', None)
         
         db.session.commit()
+        publish_member_event(order_id, 'member_left', current_user)
         return jsonify({'success': True, 'message': 'Successfully left the order'})
         
     except Exception as e:
@@ -530,52 +1701,180 @@ def leave_order():
         print(f"Error leaving order: {str(e)}")
         return jsonify({'success': False, 'message': 'Failed to leave order'})
 
-@app.route('/generate_receipt', methods=['GET'])
+@app.route('/close_order', methods=['POST'])
 @login_required
-def generate_receipt():
+def close_order():
     try:
         order_id = session.get('current_order_id')
         if not order_id:
+            return jsonify({'success': False, 'message': 'No active order'})
+
+        order = Order.query.get(order_id)
+        if not order:
+            return jsonify({'success': False, 'message': 'Order not found'})
+
+        if order.created_by != current_user.id:
+            return jsonify({
+                'success': False,
+                'message': 'Only the order creator can close the order'
+            }), 403
+
+        archive_order(order_id, 'closed')
+        session.pop('current_order_id', None)
+        db.session.commit()
+        order_events.publish(order_id, 'order_closed', {'status': 'closed'})
+
+        return jsonify({'success': True, 'message': 'Order closed'})
+
+    except IntegrityError:
+        # Archived concurrently (e.g. by the idle sweeper)
+        db.session.rollback()
+        session.pop('current_order_id', None)
+        return jsonify({'success': True, 'message': 'Order closed'})
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error closing order: {str(e)}")
+        return jsonify({'success': False, 'message': 'Failed to close order'})
+
+@app.route('/order_events/<int:order_id>')
+@login_required
+def order_event_stream(order_id):
+    order = Order.query.get(order_id)
+    if not order or not is_order_member(order_users, order.id, current_user.id):
+        return jsonify({
+            'success': False,
+            'message': 'Order not found'
+        }), 404
+
+    if not order_events.open_stream():
+        # Every stream slot here is taken; the client polls instead
+        metrics.inc('order_event_streams_rejected_total', {})
+        return jsonify({
+            'success': False,
+            'message': 'Live updates are busy, please try again later'
+        }), 503, {'Retry-After': '30'}
+
+    # EventSource sends Last-Event-ID when it reconnects. The stream itself
+    # never touches the database, so the session is released as usual when
+    # this view returns.
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    response = Response(
+        order_events.stream(order_id, last_event_id),
+        mimetype='text/event-stream'
+    )
+    # Runs when the server closes the response, even if it never started
+    response.call_on_close(order_events.close_stream)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def build_receipt(order_id):
+    """Group an order's lines by user with a single joined query.
+
+    Returns (user_orders, grand_total). Walking order.items would lazy load
+    the user of every line, so the query count would grow with the size of
+    the order. Names and prices come from the lines' own snapshot.
+    """
+    rows = db.session.query(
+        OrderItem.user_id,
+        User.name.label('user_name'),
+        OrderItem.item_name,
+        OrderItem.price,
+        OrderItem.quantity
+    ).join(
+        User, OrderItem.user_id == User.id
+    ).filter(
+        OrderItem.order_id == order_id
+    ).order_by(OrderItem.id).all()
+    return group_receipt_rows(rows)
+
+def build_archived_receipt(order_id):
+    # Archived lines carry their own name/price snapshot, no joins needed
+    rows = db.session.query(
+        ArchivedOrderItem.user_id,
+        ArchivedOrderItem.user_name,
+        ArchivedOrderItem.item_name,
+        ArchivedOrderItem.price,
+        ArchivedOrderItem.quantity
+    ).filter(
+        ArchivedOrderItem.order_id == order_id
+    ).order_by(ArchivedOrderItem.id).all()
+    return group_receipt_rows(rows)
+
+def group_receipt_rows(rows):
+    # Group items by user
+    user_orders = {}
+    for row in rows:
+        if row.user_id not in user_orders:
+            user_orders[row.user_id] = {
+                'name': row.user_name,
+                'items': [],
+                'subtotal': 0
+            }
+
+        item_total = row.quantity * row.price
+        user_orders[row.user_id]['items'].append({
+            'name': row.item_name,
+            'quantity': row.quantity,
+            'price': row.price,
+            'total': item_total
+        })
+        user_orders[row.user_id]['subtotal'] += item_total
+
+    # Calculate grand total
+    grand_total = sum(user['subtotal'] for user in user_orders.values())
+    return user_orders, grand_total
+
+def find_receipt_order(requested_id):
+    """Resolve the order a receipt is asked for.
+
+    Returns (order, archived) or (None, False). Without a requested id this
+    is the member's current order; past orders must have had the user as a
+    member. Closed and expired orders are read from the archive.
+    """
+    order_id = requested_id or session.get('current_order_id')
+    if not order_id:
+        return None, False
+
+    order = Order.query.get(order_id)
+    if order and (not requested_id or is_order_member(order_users, order.id, current_user.id)):
+        return order, False
+
+    order = ArchivedOrder.query.get(order_id)
+    if order and is_order_member(archived_order_users, order.id, current_user.id):
+        return order, True
+    return None, False
+
+@app.route('/generate_receipt', methods=['GET'])
+@login_required
+def generate_receipt():
+    try:
+        # Past orders can be requested explicitly with ?order_id=
+        requested_id = request.args.get('order_id', type=int)
+        if not requested_id and not session.get('current_order_id'):
             return jsonify({
                 'success': False,
                 'message': 'No active order'
             })
 
         # Get the order and all its items
-        order = Order.query.get(order_id)
+        order, archived = find_receipt_order(requested_id)
         if not order:
             return jsonify({
                 'success': False,
                 'message': 'Order not found'
             })
-
-        # Group items by user
-        user_orders = {}
-        for item in order.items:
-            user_id = item.user_id
-            if user_id not in user_orders:
-                user_orders[user_id] = {
-                    'name': item.user.name,
-                    'items': [],
-                    'subtotal': 0
-                }
-            
-            item_total = item.quantity * item.menu_item.price
-            user_orders[user_id]['items'].append({
-                'name': item.menu_item.name,
-                'quantity': item.quantity,
-                'price': item.menu_item.price,
-                'total': item_total
-            })
-            user_orders[user_id]['subtotal'] += item_total
-
-        # Calculate grand total
-        grand_total = sum(user['subtotal'] for user in user_orders.values())
+        if archived:
+            user_orders, grand_total = build_archived_receipt(order.id)
+        else:
+            user_orders, grand_total = build_receipt(order.id)
 
         return jsonify({
             'success': True,
+            'order_id': order.id,
             'order_name': order.name,
             'order_pin': order.pin,
+            'order_status': order.status,
             'user_orders': user_orders,
             'grand_total': grand_total
         })
@@ -587,8 +1886,221 @@ def generate_receipt():
             'message': 'Failed to generate receipt'
         })
 
+RECEIPT_EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+}
+RECEIPT_CSV_COLUMNS = ['record', 'user_id', 'user_name', 'item', 'price', 'quantity', 'amount']
+
+def build_order_totals(order_id):
+    """Quantities per menu item across the whole order, one indexed lookup."""
+    return db.session.query(
+        OrderItemTotal.menu_item_id,
+        MenuItem.name,
+        MenuItem.category,
+        OrderItemTotal.quantity,
+        OrderItemTotal.members,
+        OrderItemTotal.amount
+    ).join(
+        MenuItem, OrderItemTotal.menu_item_id == MenuItem.id
+    ).filter(
+        OrderItemTotal.order_id == order_id
+    ).order_by(MenuItem.category, MenuItem.name).all()
+
+def build_archived_order_totals(order_id):
+    # Archived orders are read-only, so summing their lines on demand is fine
+    return db.session.query(
+        ArchivedOrderItem.menu_item_id,
+        ArchivedOrderItem.item_name.label('name'),
+        literal(None, db.String).label('category'),
+        db.func.sum(ArchivedOrderItem.quantity).label('quantity'),
+        db.func.count().label('members'),
+        db.func.sum(ArchivedOrderItem.quantity * ArchivedOrderItem.price).label('amount')
+    ).filter(
+        ArchivedOrderItem.order_id == order_id
+    ).group_by(
+        ArchivedOrderItem.menu_item_id, ArchivedOrderItem.item_name
+    ).order_by(ArchivedOrderItem.item_name).all()
+
+@app.route('/order_totals', methods=['GET'])
+@login_required
+def get_order_totals():
+    """The consolidated order to place with the restaurant.
+
+    Quantities are summed per menu item over every member's cart. Takes
+    ?order_id= for past orders, like /generate_receipt.
+    """
+    try:
+        requested_id = request.args.get('order_id', type=int)
+        order, archived = find_receipt_order(requested_id)
+        if not order:
+            return jsonify({
+                'success': False,
+                'message': 'Order not found' if requested_id or session.get('current_order_id') else 'No active order'
+            })
+        rows = build_archived_order_totals(order.id) if archived else build_order_totals(order.id)
+
+        return jsonify({
+            'success': True,
+            'order_id': order.id,
+            'order_name': order.name,
+            'order_status': order.status,
+            'items': [{
+                'menu_item_id': row.menu_item_id,
+                'name': row.name,
+                'category': row.category,
+                # Lines added at different prices average out
+                'price': round(row.amount / row.quantity, 2) if row.quantity else 0,
+                'quantity': row.quantity,
+                'members': row.members,
+                'total': row.amount
+            } for row in rows],
+            'item_count': sum(row.quantity for row in rows),
+            'grand_total': sum(row.amount for row in rows)
+        })
+
+    except Exception as e:
+        print(f"Error building order totals: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Failed to build order totals'
+        })
+
+def receipt_export_query(order_id, archived):
+    # Rows come back grouped by member in index order, so SQLite never sorts
+    # and each member's subtotal can be written as soon as the group ends
+    if archived:
+        return select(
+            ArchivedOrderItem.user_id,
+            ArchivedOrderItem.user_name,
+            ArchivedOrderItem.item_name,
+            ArchivedOrderItem.price,
+            ArchivedOrderItem.quantity
+        ).where(
+            ArchivedOrderItem.order_id == order_id
+        ).order_by(ArchivedOrderItem.user_id, ArchivedOrderItem.id)
+
+    return select(
+        OrderItem.user_id,
+        User.name.label('user_name'),
+        OrderItem.item_name,
+        OrderItem.price,
+        OrderItem.quantity
+    ).join(
+        User, OrderItem.user_id == User.id
+    ).where(
+        OrderItem.order_id == order_id
+    ).order_by(OrderItem.user_id, OrderItem.menu_item_id)
+
+def receipt_export_records(order, stmt, chunk_size):
+    """Yield receipt records one chunk of rows at a time.
+
+    Uses its own connection so the stream does not depend on the request's
+    session, which is closed once the view returns. Only the current chunk
+    and one member's running subtotal are held in memory.
+    """
+    yield {'record': 'order', 'order_id': order['id'], 'name': order['name'],
+           'pin': order['pin'], 'status': order['status']}
+
+    grand_total = 0
+    current = None
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True).execute(stmt)
+        for rows in result.partitions(chunk_size):
+            for row in rows:
+                if current and current['user_id'] != row.user_id:
+                    yield current
+                    current = None
+                if current is None:
+                    current = {'record': 'subtotal', 'user_id': row.user_id,
+                               'user_name': row.user_name, 'amount': 0}
+
+                amount = row.price * row.quantity
+                current['amount'] += amount
+                grand_total += amount
+                yield {'record': 'item', 'user_id': row.user_id, 'user_name': row.user_name,
+                       'item': row.item_name, 'price': row.price, 'quantity': row.quantity,
+                       'amount': amount}
+    if current:
+        yield current
+    yield {'record': 'total', 'amount': grand_total}
+
+def receipt_export_csv(records):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=RECEIPT_CSV_COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    for record in records:
+        # The order header only makes sense in JSON Lines
+        if record['record'] == 'order':
+            continue
+        writer.writerow(record)
+        # Flush roughly every 64 KB instead of once per row
+        if buffer.tell() >= 65536:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def receipt_export_jsonl(records):
+    lines = []
+    for record in records:
+        lines.append(fast_json.dumps(record) + '\n')
+        if len(lines) >= 500:
+            yield ''.join(lines)
+            lines = []
+    yield ''.join(lines)
+
+@app.route('/receipt/export', methods=['GET'])
+@login_required
+def export_receipt():
+    """Stream an order's receipt as CSV or JSON Lines (?format=csv|jsonl).
+
+    Every line is followed by the member's subtotal once their group ends,
+    and the last record is the grand total. Memory use does not grow with
+    the size of the order.
+    """
+    try:
+        export_format = request.args.get('format', 'csv')
+        if export_format not in RECEIPT_EXPORT_FORMATS:
+            return jsonify({
+                'success': False,
+                'message': 'Format must be csv or jsonl'
+            }), 400
+
+        requested_id = request.args.get('order_id', type=int)
+        order, archived = find_receipt_order(requested_id)
+        if not order:
+            return jsonify({
+                'success': False,
+                'message': 'Order not found'
+            }), 404
+
+        # Plain values: the ORM object is detached once the view returns
+        order_info = {'id': order.id, 'name': order.name, 'pin': order.pin, 'status': order.status}
+        records = receipt_export_records(
+            order_info,
+            receipt_export_query(order.id, archived),
+            app.config['RECEIPT_EXPORT_CHUNK_SIZE']
+        )
+        writer = receipt_export_csv if export_format == 'csv' else receipt_export_jsonl
+        mimetype, extension = RECEIPT_EXPORT_FORMATS[export_format]
+
+        response = Response(writer(records), mimetype=mimetype)
+        response.headers['Content-Disposition'] = f'attachment; filename="receipt-{order.id}.{extension}"'
+        response.headers['Cache-Control'] = 'no-store'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+    except Exception as e:
+        print(f"Error exporting receipt: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Failed to export receipt'
+        }), 500
+
 @app.route('/update_quantity', methods=['POST'])
 @login_required
+@rate_limited
 def update_quantity():
     try:
         data = request.get_json()
@@ -608,34 +2120,30 @@ def update_quantity():
                 'success': False,
                 'message': 'No active order'
             })
-            
-        # Get menu item
-        menu_item = MenuItem.query.filter_by(name=item_name).first()
-        if not menu_item:
-            return jsonify({
-                'success': False,
-                'message': 'Item not found'
-            })
-        
+
+        if not touch_order(order_id):
+            return order_gone_response()
+
         # Update quantity
         order_item = OrderItem.query.filter_by(
             order_id=order_id,
             user_id=current_user.id,
-            menu_item_id=menu_item.id
+            item_name=item_name
         ).first()
         
         if order_item:
-            order_item.quantity = quantity
+            order_item.quantity = int(quantity)
+            db.session.flush()
+            revision = bump_cart_revision(order_id, current_user.id)
+
+            body = cart_update_response('Quantity updated', order_id, revision, [(order_item, order_item.quantity)])
+            event = cart_event(current_user, order_item, order_item.quantity, revision)
             db.session.commit()
-            
-            # Get updated cart
-            cart = get_cart()
-            return jsonify({
-                'success': True,
-                'message': 'Quantity updated',
-                'cart_items': cart.json['items']
-            })
+
+            order_events.publish(order_id, *event)
+            return jsonify(body)
         else:
+            db.session.rollback()
             return jsonify({
                 'success': False,
                 'message': 'Item not found in cart'
@@ -649,34 +2157,219 @@ def update_quantity():
             'message': 'Failed to update quantity'
         })
 
-def init_db():
+class CartOperationError(Exception):
+    pass
+
+def parse_quantity(value, minimum):
+    try:
+        quantity = int(value)
+    except (TypeError, ValueError):
+        raise CartOperationError('Quantity must be a whole number')
+    if quantity < minimum:
+        raise CartOperationError(f'Quantity must be at least {minimum}')
+    return quantity
+
+def parse_price(value):
+    try:
+        price = float(value)
+    except (TypeError, ValueError):
+        raise CartOperationError('Price must be a number')
+    if not math.isfinite(price) or price <= 0:
+        raise CartOperationError('Price must be a positive number')
+    return price
+
+@app.route('/cart/batch', methods=['POST'])
+@login_required
+@rate_limited
+def batch_update_cart():
+    """Apply a list of cart operations in one transaction.
+
+    Each operation is one of
+    {'op': 'add', 'item_name', 'price', 'quantity' (default 1)},
+    {'op': 'remove', 'item_name'} or
+    {'op': 'set_quantity', 'item_name', 'quantity'} (0 removes the line).
+    Either every operation is applied or none is. With ?delta=1 only the
+    touched lines are returned, like the single-item endpoints.
+    """
+    try:
+        data = request.get_json()
+        operations = data.get('operations') if data else None
+
+        if not isinstance(operations, list) or not operations:
+            return jsonify({
+                'success': False,
+                'message': 'Operations are required'
+            }), 400
+
+        if len(operations) > app.config['CART_BATCH_MAX_OPERATIONS']:
+            return jsonify({
+                'success': False,
+                'message': 'Too many operations in one batch'
+            }), 400
+
+        # Get current order
+        order_id = session.get('current_order_id')
+        if not order_id:
+            return jsonify({
+                'success': False,
+                'message': 'No active order'
+            })
+
+        if not touch_order(order_id):
+            return order_gone_response()
+
+        user_id = current_user.id
+
+        # The only cart read: every line the member currently has
+        lines = {
+            order_item.item_name: order_item
+            for order_item in OrderItem.query.filter(
+                OrderItem.order_id == order_id,
+                OrderItem.user_id == user_id
+            )
+        }
+        touched = {}
+        incremented = False
+
+        for index, operation in enumerate(operations):
+            try:
+                if not isinstance(operation, dict):
+                    raise CartOperationError('Operation must be an object')
+
+                op = operation.get('op')
+                item_name = operation.get('item_name')
+                if not item_name:
+                    raise CartOperationError('Item name is required')
+
+                if op == 'add':
+                    quantity = parse_quantity(operation.get('quantity', 1), 1)
+                    if item_name in lines:
+                        order_item = lines[item_name]
+                        # Add in SQL, like upsert_cart_line; adding to the
+                        # value we read would lose a concurrent increment
+                        db.session.flush()
+                        db.session.execute(OrderItem.__table__.update().where(
+                            OrderItem.id == order_item.id
+                        ).values(quantity=OrderItem.quantity + quantity))
+                        db.session.expire(order_item, ['quantity'])
+                        incremented = True
+                    else:
+                        price = operation.get('price')
+                        if not price:
+                            raise CartOperationError('Item name and price are required')
+                        menu_item = find_or_create_menu_item(item_name, parse_price(price))
+                        # Upsert in case another request added the line since our read
+                        upsert_cart_line(order_id, user_id, menu_item, quantity)
+                        order_item = OrderItem.query.filter_by(
+                            order_id=order_id,
+                            user_id=user_id,
+                            menu_item_id=menu_item.id
+                        ).one()
+                        lines[item_name] = order_item
+                elif op in ('remove', 'set_quantity'):
+                    if item_name not in lines:
+                        raise CartOperationError('Item not found in cart')
+                    order_item = lines[item_name]
+                    quantity = 0 if op == 'remove' else parse_quantity(operation.get('quantity'), 0)
+                    if quantity == 0:
+                        db.session.delete(order_item)
+                        del lines[item_name]
+                    else:
+                        order_item.quantity = quantity
+                else:
+                    raise CartOperationError('Unknown operation')
+
+                touched[item_name] = order_item
+            except CartOperationError as e:
+                db.session.rollback()
+                return jsonify({
+                    'success': False,
+                    'message': f'Operation {index}: {str(e)}'
+                }), 400
+
+        # Build the response and events before committing, which would
+        # otherwise expire every object and reload it line by line
+        db.session.flush()
+        if incremented:
+            # Load the quantities the increments produced in one query
+            OrderItem.query.filter(
+                OrderItem.order_id == order_id,
+                OrderItem.user_id == user_id
+            ).populate_existing().all()
+        revision = bump_cart_revision(order_id, user_id)
+        total = sum(order_item.price * order_item.quantity for order_item in lines.values())
+        changed = [
+            (order_item, order_item.quantity if name in lines else 0)
+            for name, order_item in touched.items()
+        ]
+        body = {
+            'success': True,
+            'message': 'Cart updated',
+            'revision': revision,
+            'total': total
+        }
+        if request.args.get('delta') == '1':
+            body['items'] = [cart_line(order_item, quantity) for order_item, quantity in changed]
+        else:
+            body['cart_items'] = [
+                cart_line(order_item, order_item.quantity)
+                for order_item in sorted(lines.values(), key=lambda line: line.id)
+            ]
+        events = [cart_event(current_user, order_item, quantity, revision) for order_item, quantity in changed]
+
+        db.session.commit()
+
+        for event_type, event_data in events:
+            order_events.publish(order_id, event_type, event_data)
+
+        return jsonify(body)
+
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        print(f"Database error updating cart: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Database error occurred'
+        }), 500
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error updating cart: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Failed to update cart'
+        }), 500
+
+def init_db(verbose=False):
+    """Create the schema, apply migrations and seed a new database.
+
+    Importing this module never touches the database. Run this once per
+    deploy before serving: python migrate.py, flask init-db, or gunicorn,
+    whose config runs it in the master before the workers fork.
+    """
     with app.app_context():
         # Create all tables
         db.create_all()
+        # Bring existing databases up to date (indexes, constraints)
+        run_migrations(db.engine.url.database, verbose=verbose)
+        seed_pin_pool()
         
         # Check if we already have menu items
-        if MenuItem.query.count() == 0:
-            # Add sample menu items
-            sample_items = [
-                MenuItem(name='Pizza Margherita', description='Classic tomato and mozzarella', price=12.99, category='Pizza'),
-                MenuItem(name='Pepperoni Pizza', description='Spicy pepperoni with cheese', price=14.99, category='Pizza'),
-                MenuItem(name='Caesar Salad', description='Fresh romaine lettuce with caesar dressing', price=8.99, category='Salad'),
-                MenuItem(name='Chocolate Cake', description='Rich chocolate layer cake', price=6.99, category='Dessert'),
-                MenuItem(name='Coca Cola', description='Classic cola drink', price=2.99, category='Beverages'),
-            ]
-            
-            for item in sample_items:
-                db.session.add(item)
-            
+        if MenuItem.query.first() is None:
+            # Add the sample menu
             try:
-                db.session.commit()
+                with db.engine.begin() as connection:
+                    upsert_menu_items(connection, MenuItem.__table__, read_catalog(SAMPLE_MENU))
+                menu_catalog.bump()
                 print("Sample menu items added successfully!")
             except Exception as e:
                 print(f"Error adding sample items: {e}")
-                db.session.rollback()
+        db.session.remove()
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create, migrate and seed the database (once per deploy)."""
+    init_db(verbose=True)
 
 if __name__ == '__main__':
     init_db()
     app.run(port=9091, debug=True)
-else:
-    init_db()  # This ensures the database is initialized when running on Render
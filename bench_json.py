@@ -0,0 +1,98 @@
+"""Compare JSON encoders and response compression on the API payloads.
+
+Builds one group order on a scratch database (--users members with
+--items cart lines each), then fetches the JSON endpoints through the
+Flask test client. It re-encodes each payload with every available
+encoder: Flask's own json.dumps, the stdlib backend and orjson, if it
+is installed. For each one it reports the encode time and the bytes on
+the wire raw, gzipped and brotli-compressed, using the levels the app
+is configured with.
+
+    python bench_json.py
+    python bench_json.py --users 50 --items 20 --repeat 500
+"""
+import argparse
+import gzip
+import os
+import shutil
+import tempfile
+import time
+
+ENDPOINTS = ['/menu_items', '/menu_categories', '/menu_items/search?q=beef', '/cart', '/generate_receipt', '/orders']
+
+
+def build_order(app, users, items):
+    clients = [app.test_client() for _ in range(users)]
+    order = None
+    for index, client in enumerate(clients):
+        client.post('/signup', json={'name': f'Bench {index}', 'email': f'bench-{index}@example.com', 'password': 'bench'})
+        if order is None:
+            order = client.post('/create_order', json={'order_name': 'Bench lunch'}).get_json()['order']
+        else:
+            client.post('/join_order', json={'pin': order['pin']})
+
+    menu_items = clients[0].get('/menu_items').get_json()['menu_items']
+    for index, client in enumerate(clients):
+        picks = [menu_items[(index + n) % len(menu_items)] for n in range(min(items, len(menu_items)))]
+        client.post('/cart/batch', json={'operations': [
+            {'op': 'add', 'item_name': item['name'], 'price': item['price']} for item in picks
+        ]})
+    return clients[0]
+
+
+def time_encoder(encode, payload, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        data = encode(payload)
+    return (time.perf_counter() - start) / repeat * 1e6, data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=30, help='members in the benchmark order (default 30)')
+    parser.add_argument('--items', type=int, default=10, help='cart lines per member (default 10)')
+    parser.add_argument('--repeat', type=int, default=200, help='encodes per measurement (default 200)')
+    args = parser.parse_args()
+
+    # Configure the app before importing it
+    scratch_dir = tempfile.mkdtemp(prefix='bench-json-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(scratch_dir, 'orders.db')}"
+    os.environ['ORDER_EVENTS_BACKEND'] = 'local'
+    os.environ['ORDER_SWEEP_INTERVAL'] = '0'
+    os.environ['PASSWORD_HASH_WORKERS'] = '0'
+
+    import fast_json
+    from flask import json as flask_json
+    from app import app, brotli, init_db
+
+    def flask_dumps(obj):
+        # What Flask 2.0's jsonify() did for non-debug responses
+        return (flask_json.dumps(obj, separators=(',', ':')) + '\n').encode('utf-8')
+
+    encoders = [('flask', flask_dumps)] + sorted(fast_json.BACKENDS.items())
+    gzip_level = app.config['COMPRESS_GZIP_LEVEL']
+    brotli_quality = app.config['COMPRESS_BROTLI_QUALITY']
+
+    try:
+        init_db()
+        client = build_order(app, args.users, args.items)
+        print(f"{args.users} members x {args.items} items, {args.repeat} encodes each, "
+              f"app backend: {fast_json.backend}{'' if brotli else ' (brotli not installed)'}\n")
+        print(f"{'endpoint':<30} {'encoder':<8} {'encode us':>10} {'raw B':>9} {'gzip B':>9} {'br B':>9}")
+        for path in ENDPOINTS:
+            response = client.get(path)
+            if response.status_code != 200:
+                print(f"{path:<30} HTTP {response.status_code}, skipped")
+                continue
+            payload = response.get_json()
+            for name, encode in encoders:
+                micros, data = time_encoder(encode, payload, args.repeat)
+                gzipped = len(gzip.compress(data, compresslevel=gzip_level))
+                brotlied = len(brotli.compress(data, quality=brotli_quality)) if brotli else '-'
+                print(f"{path:<30} {name:<8} {micros:>10.1f} {len(data):>9} {gzipped:>9} {brotlied:>9}")
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""Time the hot routes against a large database.
+
+Run generate_dataset.py first. This picks --samples active orders and
+members deterministically from the database and calls each route as that
+member through the Flask test client: /check_auth, /cart,
+/generate_receipt, /order_totals, /orders and /join_order (as a user not
+yet in the order). The largest active order is also measured on its own.
+For every route it reports latency percentiles, the SQL statements per
+request and the time spent in SQLite.
+
+    python bench_scale.py --database big.db
+    python bench_scale.py --database big.db --json scale.json
+    python bench_scale.py --database big.db --baseline scale.json   # compare
+
+Only /join_order writes to the database. The memberships it adds are
+removed again at the end of the run.
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+
+from loadtest import percentile
+
+
+class QueryCounter:
+    """Counts statements and SQLite time while a request runs."""
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def before(self, conn, cursor, statement, parameters, context, executemany):
+        self.local.start = time.perf_counter()
+
+    def after(self, conn, cursor, statement, parameters, context, executemany):
+        self.local.statements = getattr(self.local, 'statements', 0) + 1
+        self.local.seconds = getattr(self.local, 'seconds', 0.0) + time.perf_counter() - self.local.start
+
+    def reset(self):
+        self.local.statements = 0
+        self.local.seconds = 0.0
+
+
+def pick_samples(db, order_users, Order, samples, seed):
+    """(order_id, pin, member_id, outsider_id) for sampled active orders."""
+    rng = random.Random(seed)
+    orders = db.session.query(Order.id, Order.pin).filter(Order.status == 'active').order_by(Order.id).all()
+    picked = rng.sample(orders, min(samples, len(orders)))
+    max_user = db.session.query(db.func.max(order_users.c.user_id)).scalar()
+
+    result = []
+    for order_id, pin in picked:
+        members = [user_id for user_id, in db.session.query(order_users.c.user_id).filter(
+            order_users.c.order_id == order_id
+        ).order_by(order_users.c.user_id)]
+        member_set = set(members)
+        outsider = rng.randint(1, max_user)
+        while outsider in member_set:
+            outsider = rng.randint(1, max_user)
+        result.append((order_id, pin, rng.choice(members), outsider))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', required=True, help='database made by generate_dataset.py')
+    parser.add_argument('--samples', type=int, default=200, help='orders sampled per route (default 200)')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for the samples (default 1)')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='results file from an earlier run to compare against')
+    options = parser.parse_args()
+
+    if not os.path.exists(options.database):
+        parser.exit(1, f"Error: {options.database} does not exist; run generate_dataset.py first\n")
+
+    # Configure the app before importing it
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(options.database)}'
+    os.environ['ORDER_EVENTS_BACKEND'] = 'local'
+    os.environ['ORDER_SWEEP_INTERVAL'] = '0'
+    os.environ['RATE_LIMIT_BACKEND'] = 'off'
+    os.environ['SLOW_QUERY_THRESHOLD_MS'] = '60000'
+    os.environ['SLOW_REQUEST_THRESHOLD_MS'] = '60000'
+
+    from sqlalchemy import event
+    from app import app, db, ArchivedOrderItem, Order, OrderItem, User, order_users
+
+    counter = QueryCounter()
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', counter.before)
+        event.listen(db.engine, 'after_cursor_execute', counter.after)
+        sizes = {
+            'users': db.session.query(db.func.count(User.id)).scalar(),
+            'active_orders': db.session.query(db.func.count(Order.id)).scalar(),
+            'order_items': db.session.query(db.func.count(OrderItem.id)).scalar(),
+            'archived_order_items': db.session.query(db.func.count(ArchivedOrderItem.id)).scalar(),
+        }
+        samples = pick_samples(db, order_users, Order, options.samples, options.seed)
+        largest = db.session.query(OrderItem.order_id).group_by(OrderItem.order_id).order_by(
+            db.func.count().desc(), OrderItem.order_id
+        ).limit(1).scalar()
+        members = db.session.query(order_users.c.user_id).filter(order_users.c.order_id == largest).order_by(
+            order_users.c.user_id).first()
+        largest_member = members[0] if members else None
+        db.session.remove()
+
+    client = app.test_client()
+    timings = defaultdict(list)
+    statements = defaultdict(list)
+    sql_seconds = defaultdict(list)
+    errors = defaultdict(int)
+
+    def login(user_id, order_id):
+        with client.session_transaction() as session:
+            # Log in by session, as the login route would, minus the hashing
+            session.clear()
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+            if order_id is not None:
+                session['current_order_id'] = order_id
+
+    def call(route, user_id, order_id, method, path, body=None):
+        login(user_id, order_id)
+        counter.reset()
+        start = time.perf_counter()
+        response = client.open(path, method=method, json=body)
+        elapsed = time.perf_counter() - start
+        data = response.get_json(silent=True)
+        if response.status_code >= 400 or (isinstance(data, dict) and data.get('success') is False):
+            errors[route] += 1
+        timings[route].append(elapsed)
+        statements[route].append(counter.local.statements)
+        sql_seconds[route].append(counter.local.seconds)
+
+    joined = []
+    try:
+        # Warm the caches and connection pool, unmeasured
+        if samples:
+            order_id, _, member_id, _ = samples[0]
+            login(member_id, order_id)
+            for path in ('/check_auth', '/cart', '/generate_receipt', '/order_totals', '/orders'):
+                client.get(path)
+
+        for order_id, pin, member_id, outsider_id in samples:
+            call('GET /check_auth', member_id, order_id, 'GET', '/check_auth')
+            call('GET /cart', member_id, order_id, 'GET', '/cart')
+            call('GET /generate_receipt', member_id, order_id, 'GET', '/generate_receipt')
+            call('GET /order_totals', member_id, order_id, 'GET', '/order_totals')
+            call('GET /orders', member_id, None, 'GET', '/orders')
+            call('POST /join_order', outsider_id, None, 'POST', '/join_order', {'pin': pin})
+            joined.append((outsider_id, order_id))
+
+        if largest_member is not None:
+            for _ in range(max(1, min(20, options.samples // 10))):
+                call('GET /generate_receipt [largest]', largest_member, largest, 'GET', '/generate_receipt')
+                call('GET /order_totals [largest]', largest_member, largest, 'GET', '/order_totals')
+    finally:
+        if joined:
+            with app.app_context():
+                with db.engine.begin() as connection:
+                    for user_id, order_id in joined:
+                        connection.execute(order_users.delete().where(
+                            (order_users.c.user_id == user_id) & (order_users.c.order_id == order_id)
+                        ))
+
+    routes = {}
+    for route, values in timings.items():
+        values = sorted(values)
+        routes[route] = {
+            'requests': len(values),
+            'errors': errors.get(route, 0),
+            'p50_ms': percentile(values, 50) * 1000,
+            'p95_ms': percentile(values, 95) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+            'max_ms': values[-1] * 1000,
+            'sql_statements': sum(statements[route]) / len(values),
+            'sql_p50_ms': percentile(sorted(sql_seconds[route]), 50) * 1000,
+        }
+    summary = {'dataset': sizes, 'largest_order_id': largest, 'samples': options.samples, 'routes': routes}
+
+    baseline = None
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+
+    print(', '.join(f"{count:,} {name.replace('_', ' ')}" for name, count in sizes.items()))
+    header = (f"{'route':<32}{'reqs':>6}{'errs':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+              f"{'sql/req':>9}{'sql ms':>8}")
+    if baseline:
+        header += f"{'p95 vs base':>13}"
+    print(header)
+    print('-' * len(header))
+    for route, stats in routes.items():
+        line = (f"{route:<32}{stats['requests']:>6}{stats['errors']:>6}{stats['p50_ms']:>9.2f}"
+                f"{stats['p95_ms']:>9.2f}{stats['p99_ms']:>9.2f}{stats['max_ms']:>9.2f}"
+                f"{stats['sql_statements']:>9.1f}{stats['sql_p50_ms']:>8.2f}")
+        base = baseline['routes'].get(route) if baseline else None
+        if base and base['p95_ms']:
+            line += f"{(stats['p95_ms'] / base['p95_ms'] - 1) * 100:>+12.1f}%"
+        print(line)
+    if baseline and baseline.get('dataset') != sizes:
+        print("Note: the baseline was measured on a dataset of a different size")
+
+    if options.json:
+        with open(options.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
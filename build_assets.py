@@ -0,0 +1,98 @@
+"""Fingerprint and precompress the static assets.
+
+Copies every file under static/ to static/dist/ with a content hash in
+its name (js/main.js -> js/main.3f2a9c1b7d4e.js). Text assets also get
+gzip and, if the brotli package is installed, brotli versions next to
+them. static/dist/manifest.json maps the original paths to the hashed
+ones. asset_url() in templates uses it to emit hashed URLs.
+
+A hashed file never changes, so /assets/ serves it with a one-year
+immutable Cache-Control and browsers do not ask for it again. Any edit
+produces a new name. gunicorn.conf.py runs the build on startup. Run it
+by hand after editing assets under the dev server:
+
+    python build_assets.py
+"""
+import gzip
+import hashlib
+import json
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_FILE = os.path.join(DIST_DIR, 'manifest.json')
+COMPRESSIBLE = ('.js', '.css', '.svg', '.json', '.txt', '.html', '.map')
+
+
+def iter_assets(static_dir):
+    for root, dirs, files in os.walk(static_dir):
+        if root == static_dir:
+            # Skip our own output
+            dirs[:] = [d for d in dirs if d != 'dist']
+        for name in sorted(files):
+            if not name.startswith('.'):
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, static_dir).replace(os.sep, '/'), path
+
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def build(static_dir=STATIC_DIR, verbose=False):
+    """Build static/dist and its manifest. Returns the manifest."""
+    dist_dir = os.path.join(static_dir, 'dist')
+    manifest = {}
+    outputs = set()
+
+    for rel_path, path in iter_assets(static_dir):
+        with open(path, 'rb') as f:
+            data = f.read()
+        stem, ext = os.path.splitext(rel_path)
+        hashed = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+        manifest[rel_path] = hashed
+
+        target = os.path.join(dist_dir, hashed)
+        variants = [(target, data)]
+        if ext.lower() in COMPRESSIBLE:
+            # mtime=0 keeps the gzip bytes identical between builds
+            variants.append((target + '.gz', gzip.compress(data, compresslevel=9, mtime=0)))
+            if brotli is not None:
+                variants.append((target + '.br', brotli.compress(data, quality=11)))
+
+        for variant_path, variant in variants:
+            # Only keep compressed copies that actually save bytes
+            if variant_path != target and len(variant) >= len(data):
+                continue
+            outputs.add(os.path.abspath(variant_path))
+            if not os.path.exists(variant_path):
+                write_file(variant_path, variant)
+            if verbose:
+                print(f"{os.path.relpath(variant_path, static_dir)} ({len(variant)} bytes)")
+
+    write_file(os.path.join(dist_dir, 'manifest.json'), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    outputs.add(os.path.abspath(os.path.join(dist_dir, 'manifest.json')))
+
+    # Drop assets from earlier builds that nothing points at any more
+    for root, _, files in os.walk(dist_dir):
+        for name in files:
+            path = os.path.abspath(os.path.join(root, name))
+            if path not in outputs:
+                os.remove(path)
+    return manifest
+
+
+if __name__ == '__main__':
+    manifest = build(verbose=True)
+    print(f"Built {len(manifest)} assets into {os.path.relpath(DIST_DIR, BASE_DIR)}"
+          f"{'' if brotli else ' (brotli not installed, gzip only)'}")
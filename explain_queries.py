@@ -0,0 +1,104 @@
+"""Print SQLite's EXPLAIN QUERY PLAN for the queries each endpoint issues.
+
+Drives one ordering session (signup, create/join, cart edits, receipt,
+close) through the Flask test client against a scratch copy of the
+database. It records every statement per endpoint and explains it. Look
+for "SCAN" lines on hot tables: those are queries no index serves.
+
+    python explain_queries.py                     # fresh scratch database
+    python explain_queries.py --database orders.db  # plans against real data sizes
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+from collections import OrderedDict
+
+
+def run_session(client_a, client_b):
+    client_a.post('/signup', json={'name': 'Explain A', 'email': 'explain-a@example.com', 'password': 'explain'})
+    client_b.post('/signup', json={'name': 'Explain B', 'email': 'explain-b@example.com', 'password': 'explain'})
+    client_a.get('/check_auth')
+    client_a.get('/menu_items')
+
+    order = client_a.post('/create_order', json={'order_name': 'Explain lunch'}).get_json()['order']
+    client_b.post('/join_order', json={'pin': order['pin']})
+    client_b.get(f"/order_events/{order['id']}", buffered=False).close()
+
+    menu_items = client_a.get('/menu_items').get_json()['menu_items'][:2]
+    for item in menu_items:
+        client_a.post('/add_to_cart', json={'item_name': item['name'], 'price': item['price']})
+        client_b.post('/add_to_cart', json={'item_name': item['name'], 'price': item['price']})
+    client_b.post('/update_quantity', json={'item_name': menu_items[0]['name'], 'quantity': 3})
+    client_b.post('/remove_from_cart', json={'item_name': menu_items[1]['name']})
+    client_b.post('/cart/batch', json={'operations': [
+        {'op': 'add', 'item_name': menu_items[1]['name'], 'price': menu_items[1]['price']},
+        {'op': 'set_quantity', 'item_name': menu_items[0]['name'], 'quantity': 2},
+    ]})
+    client_a.get('/cart')
+    client_a.get('/generate_receipt')
+    client_a.get('/order_totals')
+    client_b.post('/leave_order')
+    client_a.post('/close_order')
+    client_a.get(f"/generate_receipt?order_id={order['id']}")
+    client_a.get(f"/order_totals?order_id={order['id']}")
+    client_b.get('/orders?limit=1')
+    client_b.get(f"/orders?status=closed,expired&cursor={order['id'] + 1}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', help='existing orders.db to copy (it is never modified)')
+    args = parser.parse_args()
+
+    scratch_dir = tempfile.mkdtemp(prefix='explain-')
+    database_path = os.path.join(scratch_dir, 'orders.db')
+    if args.database:
+        shutil.copyfile(args.database, database_path)
+
+    # Configure the app before importing it
+    os.environ['DATABASE_URL'] = f'sqlite:///{database_path}'
+    os.environ['ORDER_EVENTS_BACKEND'] = 'local'
+    os.environ['ORDER_SWEEP_INTERVAL'] = '0'
+
+    from flask import has_request_context, request
+    from sqlalchemy import event
+    from app import app, db, init_db
+
+    init_db()
+
+    statements = OrderedDict()
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if executemany or not has_request_context():
+            return
+        endpoint = request.endpoint or request.path
+        statements.setdefault(endpoint, OrderedDict()).setdefault(statement, parameters)
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', record)
+
+    run_session(app.test_client(), app.test_client())
+
+    conn = sqlite3.connect(database_path)
+    try:
+        for endpoint, queries in statements.items():
+            print(f"== {endpoint} ({len(queries)} distinct statements)")
+            for statement, parameters in queries.items():
+                print(f"\n  {' '.join(statement.split())}")
+                try:
+                    plan = conn.execute(f'EXPLAIN QUERY PLAN {statement}', parameters).fetchall()
+                except sqlite3.Error as e:
+                    print(f"    (not explainable: {e})")
+                    continue
+                for _, parent, _, detail in plan:
+                    print(f"    {'  ' if parent else ''}{detail}")
+            print()
+    finally:
+        conn.close()
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
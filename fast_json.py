@@ -0,0 +1,55 @@
+"""JSON encoding for API responses, using orjson when it is installed.
+
+orjson encodes the receipt and menu payloads several times faster than
+the stdlib json module that Flask 2.0's jsonify() uses. It is optional:
+without it, encoding falls back to the stdlib with compact separators.
+Both backends produce equivalent JSON. Non-string dict keys (receipts are
+keyed by user id) become strings, and dates become ISO 8601 strings.
+
+Set JSON_BACKEND=json to force the stdlib, e.g. to compare the two.
+"""
+import datetime
+import decimal
+import json
+import os
+import uuid
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj):
+    if isinstance(obj, (datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def stdlib_dumps(obj):
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False, default=_default).encode('utf-8')
+
+
+if orjson is not None:
+    def orjson_dumps(obj):
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+else:
+    orjson_dumps = None
+
+BACKENDS = {'json': stdlib_dumps}
+if orjson_dumps is not None:
+    BACKENDS['orjson'] = orjson_dumps
+
+backend = os.environ.get('JSON_BACKEND') or ('orjson' if orjson_dumps else 'json')
+if backend not in BACKENDS:
+    backend = 'json'
+dumpb = BACKENDS[backend]
+
+
+def dumps(obj):
+    """Encode obj as a JSON str."""
+    return dumpb(obj).decode('utf-8')
@@ -0,0 +1,232 @@
+"""Fill a new database with a deterministic, production-sized dataset.
+
+Creates users, a larger menu, active orders with their memberships and
+cart lines, and a long history of closed and expired orders in the
+archive tables. Member counts and cart sizes follow a long-tailed
+distribution, and --large-orders active orders get --max-members members
+each. Apart from password salts and the timestamps of active orders,
+the data depends only on --seed and the size options, so two runs with
+the same options produce the same rows. Active orders are stamped with
+the current time so the idle sweeper does not archive them right away.
+
+Rows are bulk inserted with executemany in one transaction per batch of
+orders. The order_item triggers keep order_item_total in step as usual.
+Every user's password is "password" and their email is
+user<id>@example.com.
+
+    python generate_dataset.py --database big.db
+    python generate_dataset.py --database huge.db --users 500000 --archived-orders 400000 --active-orders 8000
+
+Then run bench_scale.py --database big.db against it.
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+# Timestamps of archived orders count back from here
+BASE_TIME = datetime(2025, 1, 1)
+FIRST_NAMES = ['Ada', 'Ben', 'Chen', 'Dana', 'Eli', 'Fatima', 'Gus', 'Hana', 'Ivan', 'Jo',
+               'Kemi', 'Luis', 'Mina', 'Noor', 'Omar', 'Priya', 'Quinn', 'Rosa', 'Sam', 'Tariq']
+LAST_NAMES = ['Adams', 'Brown', 'Costa', 'Diaz', 'Evans', 'Fischer', 'Garcia', 'Hughes', 'Ito', 'Jones',
+              'Kim', 'Lopez', 'Moore', 'Nguyen', 'Okafor', 'Patel', 'Reyes', 'Silva', 'Tanaka', 'Wong']
+DISHES = ['Noodles', 'Curry', 'Burrito', 'Salad', 'Ramen', 'Taco', 'Pizza', 'Burger', 'Wrap', 'Bowl']
+STYLES = ['Spicy', 'Classic', 'Smoky', 'Garlic', 'Vegan', 'Crispy', 'Lemon', 'Sesame', 'Truffle', 'Herb']
+CATEGORIES = ['Mains', 'Sides', 'Drinks', 'Desserts', 'Specials']
+QUANTITIES = [1, 1, 1, 1, 1, 1, 2, 2, 2, 3]
+
+
+def long_tail(rng, mean, maximum):
+    """1 + an exponential draw: mostly small, now and then large."""
+    if mean <= 1:
+        return 1
+    return min(maximum, 1 + int(rng.expovariate(1.0 / (mean - 1))))
+
+
+def synthetic_menu(rng, count):
+    for n in range(count):
+        yield n + 1, {
+            'name': f'{rng.choice(STYLES)} {rng.choice(DISHES)} {n + 1}',
+            'description': None,
+            'price': round(rng.uniform(2, 30), 2),
+            'category': rng.choice(CATEGORIES),
+        }
+
+
+class BulkWriter:
+    """Buffers rows per table and writes them with executemany.
+
+    Rows go to the driver as plain tuples; building SQLAlchemy parameters
+    for millions of rows would take longer than inserting them.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.rows = {}
+        self.columns = {}
+        self.counts = {}
+
+    def add(self, table, row):
+        if table not in self.columns:
+            self.columns[table] = list(row)
+        self.rows.setdefault(table, []).append(tuple(
+            # The format SQLAlchemy's SQLite DateTime type reads back
+            value.strftime('%Y-%m-%d %H:%M:%S.%f') if isinstance(value, datetime) else value
+            for value in row.values()
+        ))
+
+    def flush(self):
+        with self.engine.begin() as connection:
+            for table, rows in self.rows.items():
+                if rows:
+                    columns = self.columns[table]
+                    connection.exec_driver_sql(
+                        f'INSERT INTO "{table.name}" ({", ".join(columns)}) '
+                        f'VALUES ({", ".join("?" * len(columns))})',
+                        rows
+                    )
+                    self.counts[table.name] = self.counts.get(table.name, 0) + len(rows)
+        self.rows = {}
+
+
+def add_order_lines(rng, writer, table, order_id, member_ids, menu, options, created_at, user_names=None):
+    for user_id in member_ids:
+        count = long_tail(rng, options.items, min(options.max_items, len(menu)))
+        for offset, (menu_item_id, name, price) in enumerate(rng.sample(menu, count)):
+            row = {
+                'order_id': order_id,
+                'user_id': user_id,
+                'menu_item_id': menu_item_id,
+                'item_name': name,
+                'price': price,
+                'quantity': rng.choice(QUANTITIES),
+                'added_at': created_at + timedelta(seconds=offset * 30),
+            }
+            if user_names is not None:
+                row['user_name'] = user_names(user_id)
+            writer.add(table, row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', required=True, help='SQLite file to create (must not exist yet)')
+    parser.add_argument('--seed', type=int, default=1, help='random seed (default 1)')
+    parser.add_argument('--users', type=int, default=100000, help='users (default 100000)')
+    parser.add_argument('--menu-items', type=int, default=500, help='menu items added to the sample menu (default 500)')
+    parser.add_argument('--active-orders', type=int, default=5000, help='active orders, at most one per free PIN (default 5000)')
+    parser.add_argument('--archived-orders', type=int, default=200000, help='closed and expired orders (default 200000)')
+    parser.add_argument('--members', type=float, default=8, help='mean members per order (default 8)')
+    parser.add_argument('--items', type=float, default=4, help='mean cart lines per member (default 4)')
+    parser.add_argument('--max-members', type=int, default=500, help='members of the largest orders (default 500)')
+    parser.add_argument('--max-items', type=int, default=20, help='cart lines per member at most (default 20)')
+    parser.add_argument('--large-orders', type=int, default=20, help='active orders with --max-members members (default 20)')
+    parser.add_argument('--batch-orders', type=int, default=2000, help='orders per transaction (default 2000)')
+    options = parser.parse_args()
+
+    if os.path.exists(options.database):
+        parser.exit(1, f"Error: {options.database} already exists\n")
+    if options.max_members > options.users:
+        parser.exit(1, "Error: --max-members is larger than --users\n")
+
+    # Configure the app before importing it
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(options.database)}'
+    os.environ['ORDER_EVENTS_BACKEND'] = 'local'
+    os.environ['ORDER_SWEEP_INTERVAL'] = '0'
+    os.environ['PASSWORD_HASH_WORKERS'] = '0'
+    os.environ['SLOW_QUERY_THRESHOLD_MS'] = '60000'
+
+    from import_menu import upsert_menu_items
+    from app import (app, db, init_db, menu_catalog, password_hasher, ArchivedOrder, ArchivedOrderItem,
+                     FreePin, MenuItem, Order, OrderItem, User, archived_order_users, order_users)
+
+    start = time.perf_counter()
+    rng = random.Random(options.seed)
+    init_db()
+
+    with app.app_context():
+        engine = db.engine
+        with engine.begin() as connection:
+            upsert_menu_items(connection, MenuItem.__table__, synthetic_menu(rng, options.menu_items))
+        menu_catalog.bump()
+        menu = [tuple(row) for row in db.session.query(MenuItem.id, MenuItem.name, MenuItem.price).order_by(MenuItem.id)]
+        pins = db.session.query(FreePin.slot, FreePin.pin).order_by(FreePin.slot).limit(options.active_orders).all()
+        db.session.remove()
+    if len(pins) < options.active_orders:
+        parser.exit(1, f"Error: only {len(pins)} free PINs for {options.active_orders} active orders\n")
+
+    writer = BulkWriter(engine)
+
+    # One hash for everyone; hashing each user would take hours
+    password_hash = password_hasher.hash('password')
+    user_name = lambda user_id: f'{FIRST_NAMES[user_id % 20]} {LAST_NAMES[user_id // 20 % 20]} {user_id}'
+    for user_id in range(1, options.users + 1):
+        writer.add(User.__table__, {
+            'id': user_id,
+            'name': user_name(user_id),
+            'email': f'user{user_id}@example.com',
+            'password_hash': password_hash,
+        })
+    writer.flush()
+    print(f"{options.users} users ({time.perf_counter() - start:.1f}s)")
+
+    # Archived orders take the low ids, active orders the newest ones
+    user_ids = range(1, options.users + 1)
+    for n in range(options.archived_orders):
+        order_id = n + 1
+        member_ids = rng.sample(user_ids, long_tail(rng, options.members, options.max_members))
+        created_at = BASE_TIME - timedelta(minutes=(options.archived_orders - n) * 7)
+        writer.add(ArchivedOrder.__table__, {
+            'id': order_id,
+            'pin': f'{rng.randrange(10000):04d}',
+            'name': f'{rng.choice(DISHES)} run {order_id}',
+            'created_by': member_ids[0],
+            'created_at': created_at,
+            'closed_at': created_at + timedelta(hours=1),
+            'status': 'closed' if rng.random() < 0.8 else 'expired',
+        })
+        for user_id in member_ids:
+            writer.add(archived_order_users, {'user_id': user_id, 'order_id': order_id})
+        add_order_lines(rng, writer, ArchivedOrderItem.__table__, order_id, member_ids, menu, options,
+                        created_at, user_names=user_name)
+        if order_id % options.batch_orders == 0:
+            writer.flush()
+    writer.flush()
+    print(f"{options.archived_orders} archived orders ({time.perf_counter() - start:.1f}s)")
+
+    now = datetime.utcnow()
+    for n, (slot, pin) in enumerate(pins):
+        order_id = options.archived_orders + n + 1
+        members = options.max_members if n < options.large_orders else long_tail(rng, options.members, options.max_members)
+        member_ids = rng.sample(user_ids, members)
+        created_at = now - timedelta(minutes=rng.randrange(60))
+        writer.add(Order.__table__, {
+            'id': order_id,
+            'pin': pin,
+            'name': f'{rng.choice(DISHES)} run {order_id}',
+            'created_by': member_ids[0],
+            'created_at': created_at,
+            'last_activity_at': created_at,
+            'status': 'active',
+        })
+        for user_id in member_ids:
+            writer.add(order_users, {'user_id': user_id, 'order_id': order_id})
+        add_order_lines(rng, writer, OrderItem.__table__, order_id, member_ids, menu, options, created_at)
+        if (n + 1) % options.batch_orders == 0:
+            writer.flush()
+    writer.flush()
+    if pins:
+        # These PINs now belong to the active orders
+        with engine.begin() as connection:
+            connection.execute(FreePin.__table__.delete().where(FreePin.slot <= pins[-1].slot))
+    print(f"{len(pins)} active orders ({time.perf_counter() - start:.1f}s)")
+
+    elapsed = time.perf_counter() - start
+    rows = sum(writer.counts.values())
+    print(f"Wrote {rows:,} rows in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s) to {options.database}:")
+    for table, count in sorted(writer.counts.items()):
+        print(f"  {table:<24}{count:>12,}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,35 @@
 workers = 4
 bind = "0.0.0.0:10000"
 timeout = 120
+# Every open /order_events stream holds one of these threads. The app caps
+# streams at ORDER_EVENTS_MAX_STREAMS (24) per worker, which leaves 8
+# threads, the size of the database pool, for everything else.
+worker_class = "gthread"
+threads = 32
+# Import the app once in the master; workers fork with it already loaded
+preload_app = True
+
+import os
+import shutil
+
+import build_assets
+
+
+def on_starting(server):
+    # Workers write per-pid metric snapshots; start each server run from zero
+    shutil.rmtree(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'metrics'), ignore_errors=True)
+    # Fingerprinted, precompressed static files for /assets/
+    build_assets.build()
+    # Create, migrate and seed the database once, before any worker exists
+    from app import db, init_db
+    init_db()
+    db.engine.dispose()
+
+
+def post_fork(server, worker):
+    # Never share pooled SQLite connections with the master or between workers
+    from app import db, metrics
+    db.engine.dispose()
+    # The master's startup queries are not this worker's; each worker would
+    # otherwise report them again in its own snapshot
+    metrics.reset()
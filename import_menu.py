@@ -0,0 +1,227 @@
+"""Bulk import a menu catalog from CSV or JSON.
+
+CSV files need a header with name, price and category columns, and may
+have a description column. JSON files hold a list of objects with the
+same keys, or the {"menu_items": [...]} payload served by /menu_items.
+
+Items are upserted by name: new names are inserted, and existing items
+get the new price, category and description. The catalog is first
+staged in a TEMP table, which does not lock the database, and then
+applied with one INSERT ... SELECT, all in a single transaction. The
+catalog changes all at once, readers never see half an import, and live
+writes only wait for the final step. Rows that did not change are not
+rewritten.
+
+    python import_menu.py catalog.csv
+    python import_menu.py catalog.json --batch-size 5000
+    python import_menu.py catalog.csv --dry-run    # validate only
+"""
+import argparse
+import csv
+import json
+import os
+import time
+
+from sqlalchemy import column, func, select, table as sql_table, true
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from migrations import MENU_ITEM_FTS_TRIGGERS
+
+SAMPLE_MENU = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sample_menu.json')
+# Column sizes of MenuItem
+NAME_LENGTH = 80
+CATEGORY_LENGTH = 50
+DESCRIPTION_LENGTH = 200
+STAGING_TABLE = 'menu_import'
+# From this many rows on, the search index is rebuilt in one pass after
+# the import instead of row by row by its triggers, which is ~10x slower
+FTS_REBUILD_MIN_ROWS = 1000
+
+
+class CatalogError(ValueError):
+    pass
+
+
+def read_catalog(path):
+    """Yield (line, item) pairs; item is None for rows that failed validation."""
+    if path.lower().endswith('.json'):
+        rows = _json_rows(path)
+    elif path.lower().endswith('.csv'):
+        rows = _csv_rows(path)
+    else:
+        raise CatalogError('Catalog must be a .csv or .json file')
+
+    for line, row in rows:
+        try:
+            yield line, validate_item(row)
+        except CatalogError as e:
+            print(f"Skipping line {line}: {e}")
+            yield line, None
+
+
+def _json_rows(path):
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get('menu_items')
+    if not isinstance(data, list):
+        raise CatalogError('JSON catalog must be a list of items or {"menu_items": [...]}')
+    return enumerate(data, start=1)
+
+
+def _csv_rows(path):
+    # Read lazily so huge catalogs are never held in memory at once
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        missing = {'name', 'price', 'category'} - set(reader.fieldnames or [])
+        if missing:
+            raise CatalogError(f"CSV catalog is missing columns: {', '.join(sorted(missing))}")
+        # Line numbers as shown in an editor, after the header
+        yield from enumerate(reader, start=2)
+
+
+def validate_item(row):
+    if not isinstance(row, dict):
+        raise CatalogError('item must be an object')
+
+    name = (row.get('name') or '').strip()
+    category = (row.get('category') or '').strip() or 'Other'
+    description = (row.get('description') or '').strip() or None
+    if not name:
+        raise CatalogError('name is required')
+    if len(name) > NAME_LENGTH:
+        raise CatalogError(f'name is longer than {NAME_LENGTH} characters')
+    if len(category) > CATEGORY_LENGTH:
+        raise CatalogError(f'category is longer than {CATEGORY_LENGTH} characters')
+    if description and len(description) > DESCRIPTION_LENGTH:
+        raise CatalogError(f'description is longer than {DESCRIPTION_LENGTH} characters')
+    try:
+        price = round(float(row.get('price')), 2)
+    except (TypeError, ValueError):
+        raise CatalogError('price must be a number')
+    if price < 0:
+        raise CatalogError('price must not be negative')
+
+    return {'name': name, 'description': description, 'price': price, 'category': category}
+
+
+def upsert_menu_items(connection, table, items, batch_size=1000):
+    """Upsert items by name on the caller's transaction.
+
+    Returns a dict with the number of rows processed, inserted, updated,
+    left unchanged and skipped as invalid.
+    """
+    connection.exec_driver_sql(
+        f'CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} ('
+        'name TEXT PRIMARY KEY, description TEXT, price FLOAT NOT NULL, category TEXT NOT NULL)'
+    )
+    connection.exec_driver_sql(f'DELETE FROM {STAGING_TABLE}')
+
+    stats = {'processed': 0, 'invalid': 0}
+    batch = []
+
+    def flush():
+        if batch:
+            # A name listed twice keeps its last row, as upserting in order would
+            connection.exec_driver_sql(
+                f'INSERT OR REPLACE INTO {STAGING_TABLE} (name, description, price, category) '
+                'VALUES (?, ?, ?, ?)',
+                batch
+            )
+            batch.clear()
+
+    for _, item in items:
+        if item is None:
+            stats['invalid'] += 1
+            continue
+        batch.append((item['name'], item['description'], item['price'], item['category']))
+        stats['processed'] += 1
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    staged = sql_table(STAGING_TABLE, column('name'), column('description'), column('price'), column('category'))
+    stmt = sqlite_insert(table).from_select(
+        ['name', 'description', 'price', 'category'],
+        # The WHERE stops SQLite reading ON CONFLICT as a join constraint
+        select(staged.c.name, staged.c.description, staged.c.price, staged.c.category).where(true())
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['name'],
+        set_={
+            'description': stmt.excluded.description,
+            'price': stmt.excluded.price,
+            'category': stmt.excluded.category,
+        },
+        # Leave identical rows alone so re-importing a catalog writes nothing
+        where=(table.c.price != stmt.excluded.price)
+              | (table.c.category != stmt.excluded.category)
+              | table.c.description.is_distinct_from(stmt.excluded.description)
+    )
+
+    # From here on the transaction holds the write lock
+    rebuild_index = stats['processed'] >= FTS_REBUILD_MIN_ROWS and connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'menu_item_fts'"
+    ).scalar()
+    if rebuild_index:
+        for name in ('insert', 'delete', 'update'):
+            connection.exec_driver_sql(f'DROP TRIGGER IF EXISTS menu_item_fts_{name}')
+
+    count_before = connection.execute(select(func.count()).select_from(table)).scalar()
+    changed = connection.execute(stmt).rowcount
+    stats['inserted'] = connection.execute(select(func.count()).select_from(table)).scalar() - count_before
+    stats['updated'] = changed - stats['inserted']
+    stats['unchanged'] = stats['processed'] - changed
+
+    if rebuild_index:
+        for statement in MENU_ITEM_FTS_TRIGGERS:
+            connection.exec_driver_sql(statement)
+        if changed:
+            connection.exec_driver_sql("INSERT INTO menu_item_fts (menu_item_fts) VALUES ('rebuild')")
+    connection.exec_driver_sql(f'DROP TABLE temp.{STAGING_TABLE}')
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('catalog', help='.csv or .json catalog file')
+    parser.add_argument('--batch-size', type=int, default=1000, help='rows per staging executemany call (default 1000)')
+    parser.add_argument('--dry-run', action='store_true', help='validate the catalog without writing anything')
+    args = parser.parse_args()
+
+    if args.dry_run:
+        valid = invalid = 0
+        try:
+            for _, item in read_catalog(args.catalog):
+                if item is None:
+                    invalid += 1
+                else:
+                    valid += 1
+        except CatalogError as e:
+            parser.exit(1, f"Error: {e}\n")
+        print(f"{valid} valid items, {invalid} invalid")
+        return
+
+    from app import app, db, MenuItem, menu_catalog
+
+    start = time.perf_counter()
+    try:
+        with app.app_context():
+            with db.engine.begin() as connection:
+                stats = upsert_menu_items(connection, MenuItem.__table__, read_catalog(args.catalog), args.batch_size)
+    except CatalogError as e:
+        parser.exit(1, f"Error: {e}\n")
+    elapsed = time.perf_counter() - start
+
+    if stats['inserted'] or stats['updated']:
+        # Bulk writes bypass the ORM hooks that invalidate the cached catalog
+        menu_catalog.bump()
+
+    rate = stats['processed'] / elapsed if elapsed else 0.0
+    print(f"Imported {stats['processed']} items in {elapsed:.2f}s "
+          f"({rate:,.0f} rows/s): {stats['inserted']} new, {stats['updated']} updated, "
+          f"{stats['unchanged']} unchanged, {stats['invalid']} invalid")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+"""Concurrent load test that replays group ordering sessions.
+
+Simulates GROUPS groups of USERS people each. Every user signs up, logs
+in, creates (leader) or joins (members) the group's order by PIN, loads
+the menu, adds/updates/removes cart items and generates the receipt.
+Groups and their members run concurrently, one thread per user.
+
+By default the app runs in process through Flask's test client against a
+scratch database. Pass --url to drive a running server instead, e.g. a
+local ``gunicorn -c gunicorn.conf.py app:app``.
+
+    python loadtest.py --groups 20 --users 8
+    python loadtest.py --url http://localhost:10000 --json run.json
+    python loadtest.py --baseline run.json      # compare with an earlier run
+
+Reports requests/second and p50/p95/p99 latency per route.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import defaultdict
+
+
+class TestClientTransport:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None):
+        response = self.client.open(path, method=method, json=body)
+        return response.status_code, response.get_json(silent=True)
+
+
+class HttpTransport:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def request(self, method, path, body=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method)
+        if data is not None:
+            req.add_header('Content-Type', 'application/json')
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                return response.status, _parse_json(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, _parse_json(e.read())
+
+
+def _parse_json(raw):
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return None
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def call(self, transport, route, method, path, body=None):
+        start = time.perf_counter()
+        try:
+            status, data = transport.request(method, path, body)
+        except Exception:
+            status, data = 599, None
+        elapsed = time.perf_counter() - start
+
+        failed = status >= 400 or (isinstance(data, dict) and data.get('success') is False)
+        with self.lock:
+            self.latencies[route].append(elapsed)
+            if failed:
+                self.errors[route] += 1
+        return data if isinstance(data, dict) else {}
+
+
+def run_user(make_transport, recorder, run_id, group, index, order_ready, shared, options):
+    transport = make_transport()
+    call = lambda route, method, path, body=None: recorder.call(transport, route, method, path, body)
+
+    email = f'load-{run_id}-{group}-{index}@example.com'
+    call('POST /signup', 'POST', '/signup', {'name': f'Load {group}-{index}', 'email': email, 'password': 'loadtest'})
+    call('POST /login', 'POST', '/login', {'email': email, 'password': 'loadtest'})
+    call('GET /check_auth', 'GET', '/check_auth')
+
+    if index == 0:
+        created = call('POST /create_order', 'POST', '/create_order', {'order_name': f'Load group {group}'})
+        shared['pin'] = created.get('order', {}).get('pin')
+        order_ready.set()
+    else:
+        order_ready.wait()
+        if not shared.get('pin'):
+            return
+        call('POST /join_order', 'POST', '/join_order', {'pin': shared['pin']})
+
+    menu = call('GET /menu_items', 'GET', '/menu_items').get('menu_items') or []
+    if not menu:
+        return
+
+    rng = random.Random(f'{run_id}-{group}-{index}')
+    picks = rng.sample(menu, min(options.items, len(menu)))
+    for item in picks:
+        for _ in range(rng.randint(1, 3)):
+            call('POST /add_to_cart', 'POST', '/add_to_cart', {'item_name': item['name'], 'price': item['price']})
+    for item in picks[:2]:
+        call('POST /update_quantity', 'POST', '/update_quantity', {'item_name': item['name'], 'quantity': rng.randint(1, 5)})
+    if len(picks) > 1:
+        call('POST /remove_from_cart', 'POST', '/remove_from_cart', {'item_name': picks[-1]['name']})
+    if options.batch:
+        call('POST /cart/batch', 'POST', '/cart/batch', {'operations': [
+            {'op': 'add', 'item_name': item['name'], 'price': item['price']} for item in picks
+        ]})
+
+    call('GET /cart', 'GET', '/cart')
+    call('GET /generate_receipt', 'GET', '/generate_receipt')
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    rank = max(0, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(recorder, wall_time):
+    routes = {}
+    for route, values in sorted(recorder.latencies.items()):
+        values = sorted(values)
+        routes[route] = {
+            'requests': len(values),
+            'errors': recorder.errors.get(route, 0),
+            'rps': len(values) / wall_time if wall_time else 0.0,
+            'p50_ms': percentile(values, 50) * 1000,
+            'p95_ms': percentile(values, 95) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+            'max_ms': values[-1] * 1000,
+        }
+    total = sum(route['requests'] for route in routes.values())
+    return {
+        'wall_time_s': wall_time,
+        'requests': total,
+        'errors': sum(route['errors'] for route in routes.values()),
+        'rps': total / wall_time if wall_time else 0.0,
+        'routes': routes,
+    }
+
+
+def print_report(summary, baseline=None):
+    header = f"{'route':<26}{'reqs':>7}{'errs':>6}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+    if baseline:
+        header += f"{'p95 vs base':>13}"
+    print(header)
+    print('-' * len(header))
+    for route, stats in summary['routes'].items():
+        line = (f"{route:<26}{stats['requests']:>7}{stats['errors']:>6}{stats['rps']:>9.1f}"
+                f"{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}{stats['max_ms']:>9.1f}")
+        base = baseline['routes'].get(route) if baseline else None
+        if base and base['p95_ms']:
+            line += f"{(stats['p95_ms'] / base['p95_ms'] - 1) * 100:>+12.1f}%"
+        print(line)
+    print('-' * len(header))
+    line = (f"{summary['requests']} requests, {summary['errors']} errors in "
+            f"{summary['wall_time_s']:.2f}s ({summary['rps']:.1f} req/s)")
+    if baseline and baseline['rps']:
+        line += f", throughput {(summary['rps'] / baseline['rps'] - 1) * 100:+.1f}% vs baseline"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--groups', type=int, default=10, help='concurrent group orders (default 10)')
+    parser.add_argument('--users', type=int, default=5, help='people per group, including the leader (default 5)')
+    parser.add_argument('--items', type=int, default=4, help='distinct menu items each user orders (default 4)')
+    parser.add_argument('--batch', action='store_true', help='also send one /cart/batch request per user')
+    parser.add_argument('--url', help='base URL of a running server; default runs the app in process')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='results file from an earlier run to compare against')
+    options = parser.parse_args()
+
+    if options.url:
+        make_transport = lambda: HttpTransport(options.url)
+    else:
+        # Configure the app before importing it: scratch database, events,
+        # rate limits and sweeper kept in process
+        scratch_dir = tempfile.mkdtemp(prefix='loadtest-')
+        os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(scratch_dir, 'orders.db')}")
+        os.environ.setdefault('ORDER_EVENTS_BACKEND', 'local')
+        os.environ.setdefault('ORDER_SWEEP_INTERVAL', '0')
+        os.environ.setdefault('RATE_LIMIT_BACKEND', 'local')
+        from app import app, init_db
+        init_db()
+        make_transport = lambda: TestClientTransport(app)
+
+    recorder = Recorder()
+    run_id = uuid.uuid4().hex[:8]
+    threads = []
+    for group in range(options.groups):
+        order_ready = threading.Event()
+        shared = {}
+        for index in range(options.users):
+            threads.append(threading.Thread(
+                target=run_user,
+                args=(make_transport, recorder, run_id, group, index, order_ready, shared, options)
+            ))
+
+    print(f"Running {options.groups} groups x {options.users} users against "
+          f"{options.url or 'the in-process app'}...")
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    summary = summarize(recorder, time.perf_counter() - start)
+    summary['config'] = {
+        'groups': options.groups,
+        'users': options.users,
+        'items': options.items,
+        'batch': options.batch,
+        'target': options.url or 'in-process',
+    }
+
+    baseline = None
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+    print_report(summary, baseline)
+
+    if options.json:
+        with open(options.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Prometheus-format metrics shared across gunicorn workers.
+
+Each worker keeps its counters and histograms in memory. Every few seconds
+it writes a snapshot to ``<directory>/metrics-<pid>.json``. The /metrics
+endpoint merges the snapshots of every worker, past and present, so the
+exposed counters cover the whole server, not just the worker that served
+the scrape. This is the same approach as prometheus_client's multiprocess
+mode, without the extra dependency.
+"""
+import glob
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+
+class MetricsRegistry:
+    def __init__(self, directory, flush_interval=5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.definitions = {}
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._last_flush = 0.0
+
+    def counter(self, name, help_text):
+        self.definitions[name] = ('counter', help_text, None)
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.definitions[name] = ('histogram', help_text, tuple(buckets))
+
+    def inc(self, name, labels, amount=1.0):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += amount
+
+    def observe(self, name, labels, value):
+        buckets = self.definitions[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'buckets': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def reset(self):
+        """Forget everything recorded so far, e.g. in a freshly forked worker."""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._last_flush = 0.0
+
+    def maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            snapshot = {
+                'counters': [[name, labels, value] for (name, labels), value in self._counters.items()],
+                'histograms': [[name, labels, h['buckets'], h['sum'], h['count']]
+                               for (name, labels), h in self._histograms.items()],
+            }
+            self._last_flush = time.monotonic()
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'metrics-{os.getpid()}.json')
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, path)
+
+    def render(self):
+        """Merge every worker's snapshot into Prometheus text format."""
+        self.flush()
+
+        counters = defaultdict(float)
+        histograms = {}
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, labels, value in snapshot['counters']:
+                counters[(name, tuple(map(tuple, labels)))] += value
+            for name, labels, buckets, total, count in snapshot['histograms']:
+                key = (name, tuple(map(tuple, labels)))
+                merged = histograms.setdefault(key, {'buckets': [0] * len(buckets), 'sum': 0.0, 'count': 0})
+                merged['buckets'] = [a + b for a, b in zip(merged['buckets'], buckets)]
+                merged['sum'] += total
+                merged['count'] += count
+
+        lines = []
+        for name, (kind, help_text, bounds) in sorted(self.definitions.items()):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'counter':
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f'{name}{_format_labels(labels)} {value}')
+            else:
+                for (metric, labels), h in sorted(histograms.items()):
+                    if metric != name:
+                        continue
+                    for bound, count in zip(bounds, h['buckets']):
+                        lines.append(f'{name}_bucket{_format_labels(labels + (("le", _format_bound(bound)),))} {count}')
+                    lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {h["count"]}')
+                    lines.append(f'{name}_sum{_format_labels(labels)} {h["sum"]}')
+                    lines.append(f'{name}_count{_format_labels(labels)} {h["count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _format_bound(bound):
+    return repr(float(bound))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    )
+    return '{' + ','.join(escaped) + '}'
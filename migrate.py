@@ -0,0 +1,26 @@
+import argparse
+
+from app import app, db, init_db
+from migrations import pending_migrations
+
+def migrate():
+    with app.app_context():
+        pending = pending_migrations(db.engine.url.database)
+    # Also creates and seeds a new database
+    init_db(verbose=True)
+    if not pending:
+        print("Database schema is up to date")
+
+def status():
+    with app.app_context():
+        pending = pending_migrations(db.engine.url.database)
+        for version, name in pending:
+            print(f"Pending migration {version:04d}: {name}")
+        if not pending:
+            print("No pending migrations")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Create orders.db or apply pending schema migrations to it')
+    parser.add_argument('--status', action='store_true', help='list pending migrations without applying them')
+    args = parser.parse_args()
+    status() if args.status else migrate()
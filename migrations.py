@@ -0,0 +1,332 @@
+"""Versioned schema migrations for orders.db.
+
+db.create_all() only creates tables that are missing and never changes a
+table that already exists. The migrations below bring an existing database
+forward in place. Each one is recorded in schema_migrations so it runs once.
+Every migration is also safe to run on a schema that create_all() just
+built, so new and old databases end up in the same state.
+
+Run pending migrations with ``python migrate.py``.
+"""
+import sqlite3
+from datetime import datetime
+
+MIGRATIONS = []
+
+
+def migration(version, name):
+    def register(fn):
+        MIGRATIONS.append((version, name, fn))
+        return fn
+    return register
+
+
+@migration(1, 'unique cart lines and menu item names')
+def unique_constraints(conn):
+    statements = [
+        # Point cart lines at the first of any duplicated menu item names
+        '''UPDATE order_item SET menu_item_id = (
+               SELECT MIN(m2.id) FROM menu_item m1 JOIN menu_item m2 ON m2.name = m1.name
+               WHERE m1.id = order_item.menu_item_id)
+           WHERE menu_item_id IN (SELECT id FROM menu_item)''',
+        'DELETE FROM menu_item WHERE id NOT IN (SELECT MIN(id) FROM menu_item GROUP BY name)',
+        # Fold duplicate cart lines into the oldest one
+        '''UPDATE order_item SET quantity = (
+               SELECT SUM(o2.quantity) FROM order_item o2
+               WHERE o2.order_id = order_item.order_id
+                 AND o2.user_id = order_item.user_id
+                 AND o2.menu_item_id = order_item.menu_item_id)
+           WHERE id IN (SELECT MIN(id) FROM order_item
+                        GROUP BY order_id, user_id, menu_item_id HAVING COUNT(*) > 1)''',
+        '''DELETE FROM order_item WHERE id NOT IN (
+               SELECT MIN(id) FROM order_item GROUP BY order_id, user_id, menu_item_id)''',
+        'CREATE UNIQUE INDEX IF NOT EXISTS uq_menu_item_name ON menu_item (name)',
+        'CREATE UNIQUE INDEX IF NOT EXISTS uq_order_item_line ON order_item (order_id, user_id, menu_item_id)',
+    ]
+    for statement in statements:
+        conn.execute(statement)
+
+
+@migration(2, 'never reuse order ids')
+def order_autoincrement(conn):
+    # Without AUTOINCREMENT SQLite can hand out the id of the newest order
+    # again once it is archived, and stale sessions would point at it
+    table_sql = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'order'"
+    ).fetchone()[0]
+    if 'AUTOINCREMENT' in table_sql.upper():
+        return
+
+    conn.execute('''
+        CREATE TABLE order_new (
+            id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+            pin VARCHAR(4) NOT NULL UNIQUE,
+            name VARCHAR(80) NOT NULL,
+            created_by INTEGER NOT NULL REFERENCES user (id),
+            created_at DATETIME,
+            status VARCHAR(20)
+        )''')
+    conn.execute(
+        'INSERT INTO order_new (id, pin, name, created_by, created_at, status) '
+        'SELECT id, pin, name, created_by, created_at, status FROM "order"'
+    )
+    conn.execute('DROP TABLE "order"')
+    conn.execute('ALTER TABLE order_new RENAME TO "order"')
+
+
+@migration(3, 'hot path indexes')
+def hot_path_indexes(conn):
+    # OrderItem(order_id, user_id) lookups are served by the leading
+    # columns of uq_order_item_line, and MenuItem.name by uq_menu_item_name
+    statements = [
+        # remove_from_cart / update_quantity by menu item, MenuItem deletes
+        'CREATE INDEX IF NOT EXISTS ix_order_item_menu_item_id ON order_item (menu_item_id)',
+        # check_auth's active order lookup and the idle order sweeper
+        'CREATE INDEX IF NOT EXISTS ix_order_status_created_at ON "order" (status, created_at)',
+        # Members of an order; the primary key only leads with user_id
+        'CREATE INDEX IF NOT EXISTS ix_order_users_order_id ON order_users (order_id)',
+        'CREATE INDEX IF NOT EXISTS ix_archived_order_users_order_id ON archived_order_users (order_id)',
+        'ANALYZE',
+    ]
+    for statement in statements:
+        conn.execute(statement)
+
+
+@migration(4, 'archived receipt export index')
+def archived_receipt_export_index(conn):
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS ix_archived_order_item_order_user '
+        'ON archived_order_item (order_id, user_id, id)'
+    )
+
+
+@migration(5, 'menu search index')
+def menu_search_index(conn):
+    # Browsing by category, in name order
+    conn.execute('CREATE INDEX IF NOT EXISTS ix_menu_item_category ON menu_item (category, name)')
+    create_menu_search_index(conn)
+
+
+# Full-text index over name and description. It only stores the index,
+# the text stays in menu_item. Triggers keep it in sync with every write,
+# including bulk imports that bypass the ORM.
+MENU_ITEM_FTS_TRIGGERS = [
+    '''CREATE TRIGGER IF NOT EXISTS menu_item_fts_insert AFTER INSERT ON menu_item BEGIN
+           INSERT INTO menu_item_fts (rowid, name, description) VALUES (new.id, new.name, new.description);
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS menu_item_fts_delete AFTER DELETE ON menu_item BEGIN
+           INSERT INTO menu_item_fts (menu_item_fts, rowid, name, description)
+           VALUES ('delete', old.id, old.name, old.description);
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS menu_item_fts_update AFTER UPDATE OF name, description ON menu_item BEGIN
+           INSERT INTO menu_item_fts (menu_item_fts, rowid, name, description)
+           VALUES ('delete', old.id, old.name, old.description);
+           INSERT INTO menu_item_fts (rowid, name, description) VALUES (new.id, new.name, new.description);
+       END''',
+]
+
+
+def create_menu_search_index(conn):
+    """Create menu_item_fts and its triggers, and index existing items.
+
+    Used by migration 5 and whenever create_all creates menu_item, so a
+    rebuilt schema gets the index too.
+    """
+    try:
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS menu_item_fts USING fts5("
+            "name, description, content='menu_item', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+    except sqlite3.OperationalError as e:
+        # SQLite built without FTS5: menu search falls back to LIKE
+        if 'fts5' not in str(e):
+            raise
+        return
+
+    for statement in MENU_ITEM_FTS_TRIGGERS:
+        conn.execute(statement)
+    # Index what menu_item holds now, dropping entries for rows gone since
+    conn.execute("INSERT INTO menu_item_fts (menu_item_fts) VALUES ('rebuild')")
+
+
+@migration(6, 'per-order item totals')
+def order_item_totals(conn):
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS order_item_total ('
+        'order_id INTEGER NOT NULL REFERENCES "order" (id), '
+        'menu_item_id INTEGER NOT NULL REFERENCES menu_item (id), '
+        'quantity INTEGER NOT NULL, '
+        'members INTEGER NOT NULL, '
+        'PRIMARY KEY (order_id, menu_item_id))'
+    )
+    # Superseded by ORDER_ITEM_TOTAL_TRIGGERS in migration 7
+    statements = [
+        '''CREATE TRIGGER IF NOT EXISTS order_item_total_insert AFTER INSERT ON order_item BEGIN
+               INSERT INTO order_item_total (order_id, menu_item_id, quantity, members)
+               VALUES (new.order_id, new.menu_item_id, new.quantity, 1)
+               ON CONFLICT (order_id, menu_item_id) DO UPDATE SET
+                   quantity = quantity + excluded.quantity, members = members + 1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS order_item_total_delete AFTER DELETE ON order_item BEGIN
+               UPDATE order_item_total SET quantity = quantity - old.quantity, members = members - 1
+               WHERE order_id = old.order_id AND menu_item_id = old.menu_item_id;
+               DELETE FROM order_item_total
+               WHERE order_id = old.order_id AND menu_item_id = old.menu_item_id AND members <= 0;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS order_item_total_update
+           AFTER UPDATE OF order_id, menu_item_id, quantity ON order_item BEGIN
+               UPDATE order_item_total SET quantity = quantity - old.quantity, members = members - 1
+               WHERE order_id = old.order_id AND menu_item_id = old.menu_item_id;
+               INSERT INTO order_item_total (order_id, menu_item_id, quantity, members)
+               VALUES (new.order_id, new.menu_item_id, new.quantity, 1)
+               ON CONFLICT (order_id, menu_item_id) DO UPDATE SET
+                   quantity = quantity + excluded.quantity, members = members + 1;
+               DELETE FROM order_item_total
+               WHERE order_id = old.order_id AND menu_item_id = old.menu_item_id AND members <= 0;
+           END''',
+        # Sum up the carts that already exist
+        'DELETE FROM order_item_total',
+        '''INSERT INTO order_item_total (order_id, menu_item_id, quantity, members)
+           SELECT order_id, menu_item_id, SUM(quantity), COUNT(*) FROM order_item
+           GROUP BY order_id, menu_item_id''',
+    ]
+    for statement in statements:
+        conn.execute(statement)
+
+
+# Keep order_item_total in step with every write to order_item, in the same
+# transaction, whichever code path makes it. app.py also creates these when
+# create_all() builds order_item.
+ORDER_ITEM_TOTAL_TRIGGERS = [
+    '''CREATE TRIGGER IF NOT EXISTS order_item_total_insert AFTER INSERT ON order_item BEGIN
+           INSERT INTO order_item_total (order_id, menu_item_id, quantity, members, amount)
+           VALUES (new.order_id, new.menu_item_id, new.quantity, 1, new.quantity * new.price)
+           ON CONFLICT (order_id, menu_item_id) DO UPDATE SET
+               quantity = quantity + excluded.quantity, members = members + 1,
+               amount = amount + excluded.amount;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS order_item_total_delete AFTER DELETE ON order_item BEGIN
+           UPDATE order_item_total SET quantity = quantity - old.quantity, members = members - 1,
+               amount = amount - old.quantity * old.price
+           WHERE order_id = old.order_id AND menu_item_id = old.menu_item_id;
+           DELETE FROM order_item_total
+           WHERE order_id = old.order_id AND menu_item_id = old.menu_item_id AND members <= 0;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS order_item_total_update
+       AFTER UPDATE OF order_id, menu_item_id, quantity, price ON order_item BEGIN
+           UPDATE order_item_total SET quantity = quantity - old.quantity, members = members - 1,
+               amount = amount - old.quantity * old.price
+           WHERE order_id = old.order_id AND menu_item_id = old.menu_item_id;
+           INSERT INTO order_item_total (order_id, menu_item_id, quantity, members, amount)
+           VALUES (new.order_id, new.menu_item_id, new.quantity, 1, new.quantity * new.price)
+           ON CONFLICT (order_id, menu_item_id) DO UPDATE SET
+               quantity = quantity + excluded.quantity, members = members + 1,
+               amount = amount + excluded.amount;
+           DELETE FROM order_item_total
+           WHERE order_id = old.order_id AND menu_item_id = old.menu_item_id AND members <= 0;
+       END''',
+]
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')}
+
+
+@migration(7, 'snapshot cart line names and prices')
+def order_item_snapshots(conn):
+    for name in ('insert', 'delete', 'update'):
+        conn.execute(f'DROP TRIGGER IF EXISTS order_item_total_{name}')
+
+    # Lines added before this migration get the menu's current name and price
+    if 'price' not in _columns(conn, 'order_item'):
+        conn.execute("ALTER TABLE order_item ADD COLUMN item_name VARCHAR(80) NOT NULL DEFAULT ''")
+        conn.execute('ALTER TABLE order_item ADD COLUMN price FLOAT NOT NULL DEFAULT 0')
+        # Lines whose menu item is gone keep the blank defaults
+        conn.execute(
+            'UPDATE order_item SET '
+            "item_name = COALESCE((SELECT name FROM menu_item WHERE menu_item.id = order_item.menu_item_id), ''), "
+            'price = COALESCE((SELECT price FROM menu_item WHERE menu_item.id = order_item.menu_item_id), 0)'
+        )
+    if 'amount' not in _columns(conn, 'order_item_total'):
+        conn.execute('ALTER TABLE order_item_total ADD COLUMN amount FLOAT NOT NULL DEFAULT 0')
+
+    for statement in ORDER_ITEM_TOTAL_TRIGGERS:
+        conn.execute(statement)
+    conn.execute(
+        'UPDATE order_item_total SET amount = COALESCE((SELECT SUM(quantity * price) FROM order_item '
+        'WHERE order_item.order_id = order_item_total.order_id '
+        'AND order_item.menu_item_id = order_item_total.menu_item_id), 0)'
+    )
+
+
+@migration(8, 'order activity timestamps')
+def order_activity(conn):
+    # Live orders start from their newest cart line, or their creation
+    if 'last_activity_at' not in _columns(conn, 'order'):
+        conn.execute('ALTER TABLE "order" ADD COLUMN last_activity_at DATETIME')
+        conn.execute(
+            'UPDATE "order" SET last_activity_at = MAX(created_at, COALESCE('
+            '(SELECT MAX(added_at) FROM order_item WHERE order_item.order_id = "order".id), created_at))'
+        )
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS ix_order_status_last_activity_at '
+        'ON "order" (status, last_activity_at)'
+    )
+
+
+def _ensure_version_table(conn):
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS schema_migrations ('
+        'version INTEGER PRIMARY KEY, '
+        'name TEXT NOT NULL, '
+        'applied_at TEXT NOT NULL)'
+    )
+
+
+def applied_versions(conn):
+    _ensure_version_table(conn)
+    return {version for version, in conn.execute('SELECT version FROM schema_migrations')}
+
+
+def pending_migrations(database_path):
+    conn = sqlite3.connect(database_path)
+    try:
+        applied = applied_versions(conn)
+    finally:
+        conn.close()
+    return [(version, name) for version, name, _ in sorted(MIGRATIONS) if version not in applied]
+
+
+def run_migrations(database_path, verbose=False):
+    """Apply every pending migration, each in its own transaction.
+
+    BEGIN IMMEDIATE takes the write lock up front, so when several gunicorn
+    workers boot at once only one of them applies a given migration.
+    Returns the list of versions applied by this call.
+    """
+    conn = sqlite3.connect(database_path, timeout=30, isolation_level=None)
+    applied_now = []
+    try:
+        _ensure_version_table(conn)
+        for version, name, apply in sorted(MIGRATIONS):
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if version in applied_versions(conn):
+                    conn.execute('COMMIT')
+                    continue
+                apply(conn)
+                conn.execute(
+                    'INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)',
+                    (version, name, datetime.utcnow().isoformat())
+                )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            applied_now.append(version)
+            if verbose:
+                print(f"Applied migration {version:04d}: {name}")
+    finally:
+        conn.close()
+    return applied_now
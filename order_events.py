@@ -0,0 +1,263 @@
+"""Order event bus used to push live order room updates over Server-Sent Events.
+
+Two backends are available:
+
+* ``LocalEventBackend`` keeps everything in process. It is enough for
+  ``python app.py`` or a single gunicorn worker.
+* ``SQLiteEventBackend`` appends events to a small SQLite file shared by all
+  workers. Each worker runs one poller thread that fans new rows out to its
+  own connected clients, so an event published in one worker reaches members
+  connected to any other worker.
+
+Each open stream occupies a worker thread for as long as it lives, so
+OrderEventBus caps the streams per worker. Clients turned away fall back
+to polling and try again later.
+"""
+import itertools
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import defaultdict, deque
+
+import fast_json
+
+
+class OrderEvent:
+    def __init__(self, event_id, order_id, event_type, data):
+        self.id = event_id
+        self.order_id = order_id
+        self.type = event_type
+        self.data = data
+
+    def to_sse(self):
+        return f"id: {self.id}\nevent: {self.type}\ndata: {fast_json.dumps(self.data)}\n\n"
+
+
+class Subscription:
+    def __init__(self, order_id, max_queue=256):
+        self.order_id = order_id
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.overflowed = False
+
+    def deliver(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # Slow client: end its stream so it reconnects with Last-Event-ID
+            self.overflowed = True
+
+
+class _Dispatcher:
+    """Routes events to the subscriptions connected to this worker."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = defaultdict(set)
+
+    def add(self, subscription):
+        self.subscribers[subscription.order_id].add(subscription)
+
+    def remove(self, subscription):
+        with self.lock:
+            subscribers = self.subscribers.get(subscription.order_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.subscribers[subscription.order_id]
+
+    def dispatch(self, event):
+        for subscription in list(self.subscribers.get(event.order_id, ())):
+            subscription.deliver(event)
+
+
+class LocalEventBackend:
+    def __init__(self, history=100):
+        self._dispatcher = _Dispatcher()
+        self._ids = itertools.count(1)
+        self._history = defaultdict(lambda: deque(maxlen=history))
+
+    def publish(self, order_id, event_type, data):
+        with self._dispatcher.lock:
+            event = OrderEvent(next(self._ids), order_id, event_type, data)
+            self._history[order_id].append(event)
+            self._dispatcher.dispatch(event)
+        return event
+
+    def subscribe(self, order_id, last_event_id=None):
+        subscription = Subscription(order_id)
+        with self._dispatcher.lock:
+            if last_event_id is not None:
+                for event in self._history.get(order_id, ()):
+                    if event.id > last_event_id:
+                        subscription.deliver(event)
+            self._dispatcher.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self._dispatcher.remove(subscription)
+
+
+class SQLiteEventBackend:
+    def __init__(self, path, poll_interval=0.5, retention=300):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._dispatcher = _Dispatcher()
+        self._local = threading.local()
+        self._start_lock = threading.Lock()
+        self._poller_pid = None
+        self._publish_count = itertools.count()
+
+    def _connect(self):
+        # Connections are per thread and per process (never reused after fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS order_events ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+            'order_id INTEGER NOT NULL, '
+            'type TEXT NOT NULL, '
+            'data TEXT NOT NULL, '
+            'created_at REAL NOT NULL)'
+        )
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS ix_order_events_order_id_id '
+            'ON order_events (order_id, id)'
+        )
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def publish(self, order_id, event_type, data):
+        conn = self._connect()
+        now = time.time()
+        cursor = conn.execute(
+            'INSERT INTO order_events (order_id, type, data, created_at) VALUES (?, ?, ?, ?)',
+            (order_id, event_type, fast_json.dumps(data), now)
+        )
+        # Trim old events now and then so the fanout table stays small
+        if next(self._publish_count) % 100 == 0:
+            conn.execute('DELETE FROM order_events WHERE created_at < ?', (now - self.retention,))
+        return OrderEvent(cursor.lastrowid, order_id, event_type, data)
+
+    def subscribe(self, order_id, last_event_id=None):
+        self._ensure_poller()
+        subscription = Subscription(order_id)
+        with self._dispatcher.lock:
+            # Replay under the dispatch lock so replayed events are queued
+            # before anything the poller delivers afterwards
+            if last_event_id is not None:
+                rows = self._connect().execute(
+                    'SELECT id, order_id, type, data FROM order_events '
+                    'WHERE order_id = ? AND id > ? ORDER BY id',
+                    (order_id, last_event_id)
+                ).fetchall()
+                for row in rows:
+                    subscription.deliver(self._row_to_event(row))
+            self._dispatcher.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self._dispatcher.remove(subscription)
+
+    def _row_to_event(self, row):
+        return OrderEvent(row[0], row[1], row[2], json.loads(row[3]))
+
+    def _ensure_poller(self):
+        pid = os.getpid()
+        if self._poller_pid == pid:
+            return
+        with self._start_lock:
+            if self._poller_pid == pid:
+                return
+            last_id = self._connect().execute('SELECT COALESCE(MAX(id), 0) FROM order_events').fetchone()[0]
+            thread = threading.Thread(target=self._poll, args=(last_id,), name='order-events-poller', daemon=True)
+            thread.start()
+            self._poller_pid = pid
+
+    def _poll(self, last_id):
+        conn = self._connect()
+        while True:
+            try:
+                with self._dispatcher.lock:
+                    idle = not self._dispatcher.subscribers
+                    if idle:
+                        # Nobody is listening here; just skip past what exists
+                        last_id = conn.execute('SELECT COALESCE(MAX(id), ?) FROM order_events', (last_id,)).fetchone()[0]
+                if not idle:
+                    rows = conn.execute(
+                        'SELECT id, order_id, type, data FROM order_events '
+                        'WHERE id > ? ORDER BY id LIMIT 500',
+                        (last_id,)
+                    ).fetchall()
+                    if rows:
+                        with self._dispatcher.lock:
+                            for row in rows:
+                                self._dispatcher.dispatch(self._row_to_event(row))
+                        last_id = rows[-1][0]
+                        continue
+            except sqlite3.Error as e:
+                print(f"Order event poller error: {str(e)}")
+            time.sleep(self.poll_interval)
+
+
+class OrderEventBus:
+    def __init__(self, backend, heartbeat=15, max_streams=None):
+        self.backend = backend
+        self.heartbeat = heartbeat
+        # Every open stream holds a request thread; past this many, new
+        # streams are refused so the rest of the app keeps its threads
+        self.max_streams = max_streams
+        self._streams = threading.BoundedSemaphore(max_streams) if max_streams else None
+
+    def open_stream(self):
+        """Reserve a stream slot; False if this worker is at max_streams."""
+        return self._streams is None or self._streams.acquire(blocking=False)
+
+    def close_stream(self):
+        if self._streams is not None:
+            self._streams.release()
+
+    def publish(self, order_id, event_type, data):
+        try:
+            return self.backend.publish(order_id, event_type, data)
+        except Exception as e:
+            # Live updates are best effort; never fail the request over them
+            print(f"Error publishing order event: {str(e)}")
+
+    def stream(self, order_id, last_event_id=None):
+        """Yield SSE frames for one connected order member."""
+        subscription = self.backend.subscribe(order_id, last_event_id)
+        last_sent = last_event_id or 0
+        try:
+            yield 'retry: 3000\n\n'
+            while not subscription.overflowed:
+                try:
+                    event = subscription.queue.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if event.id <= last_sent:
+                    continue
+                last_sent = event.id
+                yield event.to_sse()
+        finally:
+            self.backend.unsubscribe(subscription)
+
+
+def create_backend(name, path=None, **options):
+    # path is only used by the sqlite backend
+    if name == 'local':
+        return LocalEventBackend(**options)
+    if name == 'sqlite':
+        return SQLiteEventBackend(path, **options)
+    raise ValueError(f"Unknown order event backend: {name}")
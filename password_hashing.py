@@ -0,0 +1,104 @@
+"""Password hashing on a bounded process pool.
+
+PBKDF2 is deliberately slow. Run inline, a burst of logins at the start of
+a group order keeps every request thread busy hashing, and cart traffic
+queues up behind it. PasswordHasher sends the work to a small pool of
+helper processes instead. The number of jobs waiting for the pool is
+capped. Once the cap is reached, new jobs fail fast with HashingBusy
+instead of piling up.
+
+Each gunicorn worker gets its own pool, created on first use after the
+fork. Set workers to 0 to hash inline, e.g. for scripts.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def hash_prefix(method):
+    """The prefix werkzeug writes in front of the salt for a method.
+
+    It always spells out the iteration count, so "pbkdf2:sha256" hashes
+    start with e.g. "pbkdf2:sha256:260000$".
+    """
+    if method.startswith('pbkdf2:') and method.count(':') == 1:
+        return f'{method}:{DEFAULT_PBKDF2_ITERATIONS}'
+    return method
+
+
+class PasswordHasher:
+    def __init__(self, method, workers=2, max_pending=64, timeout=10.0):
+        self.method = method
+        self.hash_prefix = hash_prefix(method)
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._pool = None
+        self._pool_pid = None
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        if not password_hash:
+            return False
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        return not password_hash or password_hash.split('$', 1)[0] != self.hash_prefix
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+
+        with self._lock:
+            pool = self._get_pool()
+            if self._pending >= self.workers + self.max_pending:
+                raise HashingBusy()
+            self._pending += 1
+        try:
+            future = pool.submit(fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        # A job holds its slot until the pool is done with it, not just
+        # until we stop waiting, so the cap tracks the real backlog
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # Drop it if it is still queued; a running hash has to finish
+            future.cancel()
+            raise HashingBusy()
+
+    def _release(self, future=None):
+        with self._lock:
+            self._pending -= 1
+
+    def _get_pool(self):
+        # A pool inherited through fork belongs to the parent; start our own
+        if self._pool is None or self._pool_pid != os.getpid():
+            # forkserver children are forked from a clean single-threaded
+            # process, not from a worker with request threads holding locks
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            self._pool_pid = os.getpid()
+            # Jobs counted before a fork belong to the parent's pool
+            self._pending = 0
+        return self._pool
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
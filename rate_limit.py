@@ -0,0 +1,147 @@
+"""Token-bucket rate limiting for write-heavy routes.
+
+Each bucket holds up to ``burst`` tokens and refills at ``rate`` tokens
+per second. A request takes one token from every bucket it is limited
+by, e.g. the user's bucket and the order's bucket. If any of them is
+empty, it is turned away with the number of seconds until a token is
+available. No database work is done for it.
+
+Two stores are available:
+
+* ``LocalBucketStore`` keeps buckets in process. It is enough for
+  ``python app.py`` or a single gunicorn worker.
+* ``SQLiteBucketStore`` keeps them in a small SQLite file shared by all
+  workers, so a client cannot multiply its limit by landing on different
+  workers. Each take is one atomic upsert.
+
+RateLimiter also remembers rejected buckets in memory until they refill,
+so a client that keeps hammering an exhausted bucket is rejected without
+touching the shared store.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+
+class RateLimited(Exception):
+    def __init__(self, scope, retry_after):
+        super().__init__(f"Rate limit exceeded for {scope}")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+class LocalBucketStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def take(self, key, rate, burst, now):
+        """Take a token; return 0 if one was available, else seconds to wait."""
+        with self._lock:
+            tokens, updated_at, _, _ = self._buckets.get(key, (burst, now, rate, burst))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now, rate, burst)
+                return (1 - tokens) / rate
+            self._buckets[key] = (tokens - 1, now, rate, burst)
+            if len(self._buckets) > 10000:
+                # Buckets that have refilled carry no state worth keeping
+                self._buckets = {k: v for k, v in self._buckets.items()
+                                 if v[0] + (now - v[1]) * v[2] < v[3]}
+            return 0
+
+
+class SQLiteBucketStore:
+    def __init__(self, path, retention=3600):
+        self.path = path
+        self.retention = retention
+        self._local = threading.local()
+        self._take_count = 0
+
+    def _connect(self):
+        # Connections are per thread and per process (never reused after fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS rate_buckets ('
+            'key TEXT PRIMARY KEY, '
+            'tokens REAL NOT NULL, '
+            'updated_at REAL NOT NULL) WITHOUT ROWID'
+        )
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def take(self, key, rate, burst, now):
+        """Take a token; return 0 if one was available, else seconds to wait."""
+        conn = self._connect()
+        # Refill and take in one statement so workers never race each other
+        row = conn.execute(
+            'INSERT INTO rate_buckets (key, tokens, updated_at) VALUES (?1, ?3 - 1, ?4) '
+            'ON CONFLICT (key) DO UPDATE SET '
+            'tokens = MIN(?3, tokens + (?4 - updated_at) * ?2) - 1, updated_at = ?4 '
+            'WHERE MIN(?3, tokens + (?4 - updated_at) * ?2) >= 1 '
+            'RETURNING tokens',
+            (key, rate, burst, now)
+        ).fetchone()
+        if row is not None:
+            self._take_count += 1
+            if self._take_count % 1000 == 0:
+                # Buckets idle this long are full again; drop them
+                conn.execute('DELETE FROM rate_buckets WHERE updated_at < ?', (now - self.retention,))
+            return 0
+
+        row = conn.execute('SELECT tokens, updated_at FROM rate_buckets WHERE key = ?', (key,)).fetchone()
+        tokens = min(burst, row[0] + (now - row[1]) * rate) if row else burst
+        return max(1 - tokens, 0) / rate
+
+
+class RateLimiter:
+    def __init__(self, store, clock=time.time):
+        self.store = store
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._blocked = {}
+
+    def check(self, buckets):
+        """Take a token from each (scope, key, rate, burst) bucket in turn.
+
+        Raises RateLimited for the first bucket that is empty.
+        """
+        now = self.clock()
+        for scope, key, rate, burst in buckets:
+            blocked_until = self._blocked.get(key)
+            if blocked_until is not None:
+                if blocked_until > now:
+                    raise RateLimited(scope, blocked_until - now)
+                with self._lock:
+                    self._blocked.pop(key, None)
+
+            try:
+                retry_after = self.store.take(key, rate, burst, now)
+            except sqlite3.Error as e:
+                # Limiting is best effort; never fail the request over it
+                print(f"Error checking rate limit: {str(e)}")
+                continue
+            if retry_after > 0:
+                with self._lock:
+                    if len(self._blocked) > 10000:
+                        self._blocked = {k: v for k, v in self._blocked.items() if v > now}
+                    self._blocked[key] = now + retry_after
+                raise RateLimited(scope, retry_after)
+
+
+def create_store(name, path=None):
+    # path is only used by the sqlite store
+    if name == 'local':
+        return LocalBucketStore()
+    if name == 'sqlite':
+        return SQLiteBucketStore(path)
+    raise ValueError(f"Unknown rate limit store: {name}")
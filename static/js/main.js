@@ -4,6 +4,17 @@ let cart = new Map();
 let isAuthenticated = false;
 let currentUser = null;
 let currentOrder = null;
+let orderEventSource = null;
+let orderEventRetryTimer = null;
+const ORDER_EVENTS_RETRY_MS = 30000;
+let pendingCartOps = [];
+let cartFlushTimer = null;
+let cartRevision = 0;
+const CART_BATCH_DELAY_MS = 250;
+let menuSearch = { q: '', category: '', page: 0 };
+let menuSearchTimer = null;
+const MENU_PAGE_SIZE = 24;
+const MENU_SEARCH_DELAY_MS = 250;
 
 // DOM Elements
 const authScreen = document.getElementById('auth-screen');
@@ -106,6 +117,7 @@ async function logout() {
 
         if (response.ok) {
             // Clear session
+            unsubscribeFromOrderEvents();
             currentUser = null;
             cart.clear();
             // Show success message
@@ -159,6 +171,7 @@ async function createOrder(event) {
             currentOrder = responseData.order;
             showScreen('active-order');
             loadMenuItems();
+            subscribeToOrderEvents(currentOrder.id);
             showMessage(`Order created! Share this PIN with others: ${responseData.order.pin}`);
             event.target.reset();
         } else {
@@ -194,6 +207,7 @@ async function joinOrder(event) {
             currentOrder = data.order;
             showScreen('active-order');
             loadMenuItems();
+            subscribeToOrderEvents(currentOrder.id);
             showMessage('Successfully joined order!');
             event.target.reset();
         } else {
@@ -212,55 +226,156 @@ function updateOrderHeader() {
     }
 }
 
+// Live order room updates (Server-Sent Events)
+function subscribeToOrderEvents(orderId) {
+    unsubscribeFromOrderEvents();
+    if (!orderId || !window.EventSource) return;
+
+    // EventSource reconnects on its own and resumes from the last event id
+    orderEventSource = new EventSource(`/order_events/${orderId}`);
+
+    orderEventSource.addEventListener('member_joined', (event) => {
+        const data = JSON.parse(event.data);
+        if (!currentUser || data.user.id !== currentUser.id) {
+            showMessage(`${data.user.name} joined the order`);
+        }
+        refreshOpenReceipt();
+    });
+
+    orderEventSource.addEventListener('member_left', (event) => {
+        const data = JSON.parse(event.data);
+        if (!currentUser || data.user.id !== currentUser.id) {
+            showMessage(`${data.user.name} left the order`);
+        }
+        refreshOpenReceipt();
+    });
+
+    const handleCartEvent = (event) => {
+        const data = JSON.parse(event.data);
+        // Our own cart changed from another tab or device
+        if (currentUser && data.user.id === currentUser.id &&
+                (data.revision === undefined || data.revision > cartRevision)) {
+            loadCart();
+        }
+        refreshOpenReceipt();
+    };
+    orderEventSource.addEventListener('cart_item_updated', handleCartEvent);
+    orderEventSource.addEventListener('cart_item_removed', handleCartEvent);
+
+    orderEventSource.addEventListener('order_closed', (event) => {
+        const data = JSON.parse(event.data);
+        showMessage(data.status === 'expired' ? 'This order expired' : 'This order has been closed');
+        exitOrder();
+    });
+
+    // A refused stream (503 when the server is at its stream limit) is not
+    // retried by EventSource. Catch up by polling and try again later.
+    orderEventSource.addEventListener('error', () => {
+        if (!orderEventSource || orderEventSource.readyState !== EventSource.CLOSED) return;
+        orderEventSource = null;
+        const delay = ORDER_EVENTS_RETRY_MS * (0.5 + Math.random());
+        orderEventRetryTimer = setTimeout(() => {
+            orderEventRetryTimer = null;
+            loadCart();
+            refreshOpenReceipt();
+            subscribeToOrderEvents(orderId);
+        }, delay);
+    });
+}
+
+function unsubscribeFromOrderEvents() {
+    if (orderEventRetryTimer) {
+        clearTimeout(orderEventRetryTimer);
+        orderEventRetryTimer = null;
+    }
+    if (orderEventSource) {
+        orderEventSource.close();
+        orderEventSource = null;
+    }
+}
+
+function refreshOpenReceipt() {
+    const modal = document.getElementById('receipt-modal');
+    if (modal && modal.style.display === 'block') {
+        generateReceipt();
+    }
+}
+
 // Menu Items Management
+// The menu is fetched a page at a time from /menu_items/search; typing in
+// the search box or picking a category starts again from the first page.
 async function loadMenuItems() {
+    await loadMenuCategories();
+    await loadMenuPage(true);
+}
+
+async function loadMenuCategories() {
     try {
-        const response = await fetch('/menu_items');
+        const response = await fetch('/menu_categories');
         const data = await response.json();
-        
+        if (!response.ok) return;
+
+        const select = document.getElementById('menu-category-filter');
+        select.innerHTML = '<option value="">All categories</option>' + data.categories.map(category => `
+            <option value="${category.name}" ${category.name === menuSearch.category ? 'selected' : ''}>
+                ${category.name} (${category.count})
+            </option>
+        `).join('');
+    } catch (error) {
+        console.error('Error loading menu categories:', error);
+    }
+}
+
+async function loadMenuPage(reset) {
+    const page = reset ? 1 : menuSearch.page + 1;
+    const params = new URLSearchParams({ page, per_page: MENU_PAGE_SIZE });
+    if (menuSearch.q) params.set('q', menuSearch.q);
+    if (menuSearch.category) params.set('category', menuSearch.category);
+    const search = { q: menuSearch.q, category: menuSearch.category };
+
+    try {
+        const response = await fetch(`/menu_items/search?${params}`);
+        const data = await response.json();
+
         if (!response.ok) {
             throw new Error(data.message || 'Failed to load menu items');
         }
+        // Ignore pages for a search the user has since changed
+        if (search.q !== menuSearch.q || search.category !== menuSearch.category) return;
 
         const menuContainer = document.getElementById('menu-categories');
-        menuContainer.innerHTML = '';
+        if (reset) {
+            menuContainer.innerHTML = '';
+        }
+        menuSearch.page = page;
+        document.getElementById('menu-load-more').classList.toggle('hidden', !data.has_more);
 
-        // Group items by category
-        const categories = {};
-        data.menu_items.forEach(item => {
-            if (!categories[item.category]) {
-                categories[item.category] = [];
-            }
-            categories[item.category].push(item);
-        });
+        if (reset && data.menu_items.length === 0) {
+            menuContainer.innerHTML = '<p class="text-gray-500 text-center py-4">No menu items found</p>';
+            return;
+        }
 
-        // Create category sections
-        Object.entries(categories).forEach(([category, items]) => {
-            const categorySection = document.createElement('div');
-            categorySection.className = 'category-section mb-8';
-            categorySection.innerHTML = `
-                <h2 class="text-2xl font-bold mb-4">${category}</h2>
-                <div class="grid grid-cols-1 md:grid-cols-2 gap-4">
-                    ${items.map(item => `
-                        <div class="menu-item bg-white p-4 rounded-lg shadow">
-                            <div class="flex justify-between items-center">
-                                <div>
-                                    <h3 class="text-lg font-semibold">${item.name}</h3>
-                                    <p class="text-gray-600">${item.description || ''}</p>
-                                    <p class="text-lg font-bold text-indigo-600 mt-2">$${item.price.toFixed(2)}</p>
-                                </div>
-                                <button 
-                                    class="add-to-cart-btn bg-indigo-600 text-white px-4 py-2 rounded hover:bg-indigo-700"
-                                    data-item-name="${item.name}"
-                                    data-item-price="${item.price}">
-                                    Add to Cart
-                                </button>
-                            </div>
+        // Search results keep their relevance order in a single section;
+        // browsing groups items by category
+        data.menu_items.forEach(item => {
+            const sectionName = menuSearch.q ? 'Search results' : item.category;
+            getMenuSection(menuContainer, sectionName).insertAdjacentHTML('beforeend', `
+                <div class="menu-item bg-white p-4 rounded-lg shadow">
+                    <div class="flex justify-between items-center">
+                        <div>
+                            <h3 class="text-lg font-semibold">${item.name}</h3>
+                            <p class="text-gray-600">${item.description || ''}</p>
+                            <p class="text-lg font-bold text-indigo-600 mt-2">$${item.price.toFixed(2)}</p>
                         </div>
-                    `).join('')}
+                        <button 
+                            class="add-to-cart-btn bg-indigo-600 text-white px-4 py-2 rounded hover:bg-indigo-700"
+                            data-item-name="${item.name}"
+                            data-item-price="${item.price}">
+                            Add to Cart
+                        </button>
+                    </div>
                 </div>
-            `;
-            menuContainer.appendChild(categorySection);
+            `);
         });
     } catch (error) {
         console.error('Error loading menu items:', error);
@@ -268,40 +383,160 @@ async function loadMenuItems() {
     }
 }
 
+function getMenuSection(menuContainer, name) {
+    const existing = Array.from(menuContainer.children).find(section => section.dataset.category === name);
+    if (existing) {
+        return existing.querySelector('.menu-grid');
+    }
+
+    const categorySection = document.createElement('div');
+    categorySection.className = 'category-section mb-8';
+    categorySection.dataset.category = name;
+    categorySection.innerHTML = `
+        <h2 class="text-2xl font-bold mb-4">${name}</h2>
+        <div class="menu-grid grid grid-cols-1 md:grid-cols-2 gap-4"></div>
+    `;
+    menuContainer.appendChild(categorySection);
+    return categorySection.querySelector('.menu-grid');
+}
+
+function handleMenuSearchInput(event) {
+    clearTimeout(menuSearchTimer);
+    menuSearchTimer = setTimeout(() => {
+        menuSearch.q = event.target.value.trim();
+        loadMenuPage(true);
+    }, MENU_SEARCH_DELAY_MS);
+}
+
+function handleMenuCategoryChange(event) {
+    menuSearch.category = event.target.value;
+    loadMenuPage(true);
+}
+
 // Cart Management
-async function addToCart(itemName, price) {
-    if (!currentUser) {
-        showError('Please log in first');
-        return;
+// Edits are applied locally right away and sent to /cart/batch together
+// once the user pauses, so rapid +/- clicks become a single request.
+function queueCartOperation(operation) {
+    pendingCartOps.push(operation);
+    applyCartOperationLocally(operation);
+    updateCartDisplay(Array.from(cart.values()));
+
+    clearTimeout(cartFlushTimer);
+    cartFlushTimer = setTimeout(flushCartOperations, CART_BATCH_DELAY_MS);
+}
+
+function applyCartOperationLocally(operation) {
+    const item = cart.get(operation.item_name);
+
+    if (operation.op === 'add') {
+        if (item) {
+            item.quantity += 1;
+        } else {
+            cart.set(operation.item_name, {
+                name: operation.item_name,
+                price: operation.price,
+                quantity: 1
+            });
+        }
+    } else if (operation.op === 'remove') {
+        cart.delete(operation.item_name);
+    } else if (operation.op === 'set_quantity' && item) {
+        item.quantity = operation.quantity;
     }
+}
+
+async function flushCartOperations() {
+    cartFlushTimer = null;
+    if (pendingCartOps.length === 0) return;
+
+    const operations = pendingCartOps;
+    pendingCartOps = [];
 
     try {
-        const response = await fetch('/add_to_cart', {
+        // delta=1: the server only sends back the lines we touched
+        const response = await fetch('/cart/batch?delta=1', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify({
-                item_name: itemName,
-                price: parseFloat(price)
-            })
+            body: JSON.stringify({ operations })
         });
 
+        if (response.status === 429) {
+            // Rate limited: keep the edits and send them once allowed
+            pendingCartOps = operations.concat(pendingCartOps);
+            const retryAfter = parseInt(response.headers.get('Retry-After'), 10) || 1;
+            clearTimeout(cartFlushTimer);
+            cartFlushTimer = setTimeout(flushCartOperations, retryAfter * 1000);
+            return;
+        }
+
         const data = await response.json();
-        
+
+        if (data.order_closed) {
+            showMessage(data.message);
+            exitOrder();
+            return;
+        }
+
         if (response.ok && data.success) {
-            updateCartDisplay(data.cart_items);
-            showMessage('Item added to cart');
+            cartRevision = Math.max(cartRevision, data.revision);
+            // Newer edits queued meanwhile will refresh the display themselves
+            if (pendingCartOps.length === 0) {
+                data.items.forEach(item => {
+                    if (item.quantity === 0) {
+                        cart.delete(item.name);
+                    } else {
+                        cart.set(item.name, item);
+                    }
+                });
+                updateCartDisplay(Array.from(cart.values()));
+            }
         } else {
-            showError(data.message || 'Failed to add item to cart');
+            showError(data.message || 'Failed to update cart');
+            loadCart();
         }
     } catch (error) {
         console.error('Error:', error);
-        showError('Failed to add item to cart');
+        showError('Failed to update cart');
+        loadCart();
+    }
+}
+
+async function loadCart() {
+    try {
+        // The browser revalidates with If-None-Match, so an unchanged cart
+        // comes back as a 304 and is served from its cache
+        const response = await fetch('/cart');
+        const data = await response.json();
+
+        // Pending edits will bring back a fresher cart anyway
+        if (response.ok && pendingCartOps.length === 0) {
+            cartRevision = data.revision || 0;
+            updateCartDisplay(data.items);
+        }
+    } catch (error) {
+        console.error('Error loading cart:', error);
     }
 }
 
+async function addToCart(itemName, price) {
+    if (!currentUser) {
+        showError('Please log in first');
+        return;
+    }
+
+    queueCartOperation({
+        op: 'add',
+        item_name: itemName,
+        price: parseFloat(price)
+    });
+    showMessage('Item added to cart');
+}
+
 function updateCartDisplay(cartItems) {
+    cart = new Map((cartItems || []).map(item => [item.name, { ...item }]));
+
     const cartDiv = document.getElementById('cart-items');
     cartDiv.innerHTML = '';
     
@@ -349,67 +584,64 @@ function updateCartDisplay(cartItems) {
     }
 }
 
-async function updateQuantity(itemName, newQuantity) {
+function updateQuantity(itemName, newQuantity) {
     if (newQuantity < 1) return;
-    
-    try {
-        const response = await fetch('/update_quantity', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                item_name: itemName,
-                quantity: newQuantity
-            })
-        });
 
-        const data = await response.json();
-        
-        if (response.ok && data.success) {
-            updateCartDisplay(data.cart_items);
-        } else {
-            showError(data.message || 'Failed to update quantity');
-        }
-    } catch (error) {
-        console.error('Error:', error);
-        showError('Failed to update quantity');
-    }
+    queueCartOperation({
+        op: 'set_quantity',
+        item_name: itemName,
+        quantity: newQuantity
+    });
 }
 
-async function removeFromCart(itemName) {
+function removeFromCart(itemName) {
+    queueCartOperation({
+        op: 'remove',
+        item_name: itemName
+    });
+    showMessage('Item removed from cart');
+}
+
+async function leaveOrder() {
+    if (!confirm('Are you sure you want to leave this order?')) {
+        return;
+    }
+
     try {
-        const response = await fetch('/remove_from_cart', {
+        const response = await fetch('/leave_order', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                item_name: itemName
-            })
+            }
         });
 
         const data = await response.json();
-        
+
+        if (data.order_closed) {
+            exitOrder();
+            showMessage(data.message);
+            return;
+        }
+
         if (response.ok && data.success) {
-            updateCartDisplay(data.cart_items);
-            showMessage('Item removed from cart');
+            exitOrder();
+            showMessage('Successfully left the order');
         } else {
-            showError(data.message || 'Failed to remove item');
+            showError(data.message || 'Failed to leave order');
         }
     } catch (error) {
         console.error('Error:', error);
-        showError('Failed to remove item from cart');
+        showError('Failed to leave order');
     }
 }
 
-async function leaveOrder() {
-    if (!confirm('Are you sure you want to leave this order?')) {
+async function closeOrder() {
+    if (!confirm('Close this order for everyone? No more changes can be made.')) {
         return;
     }
 
     try {
-        const response = await fetch('/leave_order', {
+        const response = await fetch('/close_order', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -419,30 +651,42 @@ async function leaveOrder() {
         const data = await response.json();
 
         if (response.ok && data.success) {
-            // Clear cart and local state
-            cart.clear();
-            updateCartDisplay([]);
-            showMessage('Successfully left the order');
-            
-            // Update UI
-            document.getElementById('order-name-display').textContent = '';
-            document.getElementById('order-pin-display').textContent = '';
-            
-            // Switch to order options screen
-            showScreen('order-options');
-            
-            // Clear any active order info
-            document.getElementById('active-order-info').style.display = 'none';
+            exitOrder();
+            showMessage('Order closed');
         } else {
-            showError(data.message || 'Failed to leave order');
+            showError(data.message || 'Failed to close order');
         }
     } catch (error) {
         console.error('Error:', error);
-        showError('Failed to leave order');
+        showError('Failed to close order');
     }
 }
 
+function exitOrder() {
+    // Clear cart and local state
+    unsubscribeFromOrderEvents();
+    clearTimeout(cartFlushTimer);
+    pendingCartOps = [];
+    currentOrder = null;
+    cartRevision = 0;
+    cart.clear();
+    updateCartDisplay([]);
+
+    // Update UI
+    document.getElementById('order-name-display').textContent = '';
+    document.getElementById('order-pin-display').textContent = '';
+
+    // Switch to order options screen
+    showScreen('order-options');
+}
+
 async function generateReceipt() {
+    // Make sure our own queued edits are on the receipt
+    if (pendingCartOps.length > 0) {
+        clearTimeout(cartFlushTimer);
+        await flushCartOperations();
+    }
+
     try {
         const response = await fetch('/generate_receipt');
         const data = await response.json();
@@ -504,6 +748,11 @@ async function generateReceipt() {
                 <div class="text-right text-xl font-bold mt-4">
                     Grand Total: $${data.grand_total.toFixed(2)}
                 </div>
+                <div class="text-right text-sm mt-2">
+                    Download:
+                    <a href="/receipt/export?format=csv&order_id=${data.order_id}" class="text-indigo-600 hover:text-indigo-800">CSV</a> |
+                    <a href="/receipt/export?format=jsonl&order_id=${data.order_id}" class="text-indigo-600 hover:text-indigo-800">JSON Lines</a>
+                </div>
             `;
 
             content.innerHTML = receiptHtml;
@@ -552,6 +801,8 @@ async function checkAuth() {
                 showScreen('active-order');
                 updateOrderHeader();
                 loadMenuItems();
+                loadCart();
+                subscribeToOrderEvents(currentOrder.id);
             } else {
                 showScreen('order-options');
             }
@@ -592,6 +843,11 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     });
     
+    // Menu search and paging
+    document.getElementById('menu-search')?.addEventListener('input', handleMenuSearchInput);
+    document.getElementById('menu-category-filter')?.addEventListener('change', handleMenuCategoryChange);
+    document.getElementById('menu-load-more')?.addEventListener('click', () => loadMenuPage(false));
+
     // Menu item click handling
     document.addEventListener('click', (e) => {
         const addToCartBtn = e.target.closest('.add-to-cart-btn');